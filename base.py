@@ -3,8 +3,10 @@ import csv
 import re
 import json
 import base64
+import threading
 from enum import Enum
 from config import USERNAME, PASSWORD
+from error_sink import shared_sink
 
 class CsvColumn(Enum):
     TYPE = "type"
@@ -88,6 +90,47 @@ class Helper:
             CsvColumn.DOMAIN.value: row.get("domain") or ""
         }
 
+    def tag_for_row(self, row_data):
+        """Relative result path (also used as the task tag) for a normalized row"""
+        item_type = row_data[CsvColumn.TYPE.value]
+        url = row_data[CsvColumn.URL.value]
+        suburb = row_data[CsvColumn.SUBURB.value]
+        rank_abs = row_data[CsvColumn.RANK_ABSOLUTE.value]
+        rank_gp = row_data[CsvColumn.RANK_GROUP.value]
+
+        domain_match = self._extract_domain(url)
+        file_name = f"type-{item_type}_rg{rank_gp}_ra{rank_abs}_{domain_match}.md"
+        return os.path.join(self._slugify(suburb), self._slugify(item_type), file_name)
+
+    def build_onpage_task(self, row_data):
+        """task_post payload for a normalized row, or None when it has no crawlable URL"""
+        url = row_data[CsvColumn.URL.value]
+        if not (url and url.startswith("http") and "google.com" not in url):
+            return None
+
+        return {
+            "target": row_data[CsvColumn.DOMAIN.value],
+            "start_url": url,
+            "enable_content_parsing": True,
+            "max_crawl_pages": 1,
+            "tag": self.tag_for_row(row_data),
+        }
+
+    def save_metadata_row(self, row, row_data, output_folder="parsed_content_markdowns"):
+        """Rows without a crawlable URL are saved as metadata files straight away"""
+        full_file_path = os.path.join(output_folder, self.tag_for_row(row_data))
+        os.makedirs(os.path.dirname(full_file_path), exist_ok=True)
+
+        # Temp file + rename: FINAL_DATABASE may hardlink the previous version
+        tmp_path = f"{full_file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(
+                f"# Type: {row_data[CsvColumn.TYPE.value]} | Rank: {row_data[CsvColumn.RANK_ABSOLUTE.value]} | RG: {row_data[CsvColumn.RANK_GROUP.value]}\n"
+            )
+            f.write("### Raw Row Data:\n")
+            json.dump(row, f, indent=4)
+        os.replace(tmp_path, full_file_path)
+
     def log_error_to_files(
         self,
         row_data, # Expects normalized row data or similar dict
@@ -118,34 +161,33 @@ class Helper:
             
         log_name = "warning.txt" if rank_int <= 5 else "error.txt"
 
+        # Lines go through the shared background writer (no per-error open/exists calls, no interleaved rows)
+        sink = shared_sink()
+
         # Log to TXT in type directory
         if log_to_txt:
             item_path = os.path.join(
                 self.base_output_folder, self._slugify(suburb), self._slugify(item_type)
             )
-            if not os.path.exists(item_path):
-                os.makedirs(item_path)
-
-            with open(os.path.join(item_path, log_name), "a", encoding="utf-8") as f:
-                f.write(
-                    f"[{issue_label}] Rank: {rank_abs} (RG: {rank_gp}) | Error: {error_msg} | URL: {url}\n"
-                )
+            sink.write_line(
+                os.path.join(item_path, log_name),
+                f"[{issue_label}] Rank: {rank_abs} (RG: {rank_gp}) | Error: {error_msg} | URL: {url}",
+            )
 
         # Log to CSV
         if log_to_csv:
-            self._initialize_summary_csv()
-            with open(self.summary_csv_path, "a", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=self.summary_fields)
-                writer.writerow(
-                    {
-                        "Issue": issue_label,
-                        "suburb": suburb,
-                        "service": service,
-                        "type": item_type,
-                        "rank": rank_abs,
-                        "rank_group": rank_gp,
-                        "url": url,
-                        "error_type": log_name.replace(".txt", ""),
-                        "status": error_msg,
-                    }
-                )
+            sink.write_row(
+                self.summary_csv_path,
+                self.summary_fields,
+                {
+                    "Issue": issue_label,
+                    "suburb": suburb,
+                    "service": service,
+                    "type": item_type,
+                    "rank": rank_abs,
+                    "rank_group": rank_gp,
+                    "url": url,
+                    "error_type": log_name.replace(".txt", ""),
+                    "status": error_msg,
+                },
+            )
@@ -1,45 +1,45 @@
 import os
 import csv
+from manifest import Manifest
 
-def check_file_sizes(directory, min_size_kb=5):
-    # تبدیل کیلوبایت به بایت
-    min_size_bytes = min_size_kb * 1024
+def check_file_sizes(directory):
+    # کیفیت هر فایل هنگام ذخیره محاسبه و در manifest ثبت شده است (quality.py) — دیگر حجم فایل ملاک نیست
     results = []
     
     if not os.path.exists(directory):
         print(f"❌ Error: Directory '{directory}' not found!")
         return
 
-    print(f"🔍 Scanning files in '{directory}' for sizes below {min_size_kb}KB...")
-    
-    # لیست کردن تمام فایل‌های داخل پوشه
-    files = [f for f in os.listdir(directory) if f.endswith('.md')]
+    print(f"🔍 Scanning files in '{directory}' for low-quality content...")
     
+    # فایل‌ها از manifest خوانده می‌شوند (فقط فایل‌های تغییر کرده دوباره خوانده می‌شوند)
+    manifest = Manifest()
+    manifest.refresh(directory)
+
     low_quality_count = 0
-    total_files_scanned = 0
-    
-    for root, dirs, files in os.walk(directory):
-        for filename in files:
-            if filename.endswith('.md'):  # Only .md files
-                filepath = os.path.join(root, filename)
-                file_size = os.path.getsize(filepath)
-                total_files_scanned += 1
-                
-                if file_size < min_size_bytes:
-                    size_kb = round(file_size / 1024, 2)
-                    results.append({
-                        'file_name': filename,
-                        'full_path': filepath,  # ✅ Added full path for clarity
-                        'size_kb': size_kb,
-                        'status': '⚠️ LOW_CONTENT'
-                    })
-                    low_quality_count += 1
-                    print(f"⚠️ Warning: {filepath} is only {size_kb}KB")
+    total_files_scanned = manifest.count(directory, suffix=".md")
+
+    for item in manifest.files(directory, suffix=".md", low_quality=True):
+        filepath = item['path']
+        size_kb = round(item['size'] / 1024, 2)
+        results.append({
+            'file_name': os.path.basename(filepath),
+            'full_path': filepath,  # ✅ Added full path for clarity
+            'size_kb': size_kb,
+            'words': item['words'],
+            'headings': item['headings'],
+            'http_status': item['status_code'],
+            'quality': item['quality'],
+            'status': '⚠️ LOW_CONTENT'
+        })
+        low_quality_count += 1
+        print(f"⚠️ Warning: {filepath} is {item['quality']} ({item['words']} words)")
     # ذخیره نتایج در یک فایل CSV
     output_file = 'low_quality_content_report.csv'
     with open(output_file, 'w', newline='', encoding='utf-8') as f:
         # Added 'full_path' to fieldnames to match the data structure
-        writer = csv.DictWriter(f, fieldnames=['file_name', 'full_path', 'size_kb', 'status'])
+        writer = csv.DictWriter(f, fieldnames=['file_name', 'full_path', 'size_kb', 'words', 'headings',
+                                               'http_status', 'quality', 'status'])
         writer.writeheader()
         writer.writerows(results)
 
@@ -0,0 +1,126 @@
+import atexit
+import csv
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+QUEUE_SIZE = 10000  # pending log lines before writers block (backpressure instead of unbounded memory)
+BATCH_SIZE = 500  # lines written per flush at most
+FLUSH_INTERVAL = 1.0  # seconds; readers of the logs lag by at most this much
+MAX_OPEN_FILES = 128  # kept-open handles (one per suburb/type .txt log + the CSVs)
+
+_STOP = object()
+
+
+class ErrorSink:
+    """Single background writer for the error CSV and the per-type warning/error logs.
+
+    Any thread enqueues complete lines; only the writer thread touches the
+    files, so CSV rows can never interleave. Handles stay open (LRU-capped)
+    and are flushed once per batch. Pending lines are written on close() and
+    at interpreter exit.
+    """
+
+    def __init__(self, queue_size=QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._files = OrderedDict()  # path -> open handle, least recently used first
+        self._csv_ready = set()  # CSV paths whose header is known to exist
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="error-sink", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---------------- PRODUCERS ----------------
+    def write_line(self, path, line):
+        """Append one text line (newline added) to path"""
+        self._queue.put(("txt", path, line, None))
+
+    def write_row(self, path, fieldnames, row):
+        """Append one CSV row (dict) to path, writing the header first if the file is new"""
+        self._queue.put(("csv", path, row, tuple(fieldnames)))
+
+    def flush(self):
+        """Block until everything queued so far is on disk"""
+        if not self._closed:
+            self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    # ---------------- WRITER THREAD ----------------
+    def _handle(self, path, kind):
+        f = self._files.pop(path, None)
+        if f is None:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            # csv writes its own line endings; .txt logs keep the platform's
+            f = open(path, "a", newline="" if kind == "csv" else None, encoding="utf-8")
+            while len(self._files) >= MAX_OPEN_FILES:
+                self._files.popitem(last=False)[1].close()
+        self._files[path] = f
+        return f
+
+    def _write(self, kind, path, payload, fieldnames):
+        f = self._handle(path, kind)
+        if kind == "txt":
+            f.write(f"{payload}\n")
+            return
+
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        if path not in self._csv_ready:
+            if f.tell() == 0:
+                writer.writeheader()
+            self._csv_ready.add(path)
+        writer.writerow(payload)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            deadline = time.time() + FLUSH_INTERVAL
+            while len(batch) < BATCH_SIZE and batch[-1] is not _STOP:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.time())))
+                except queue.Empty:
+                    break
+
+            # One bad item (unwritable path, row that does not fit the header) is logged and skipped:
+            # the thread must live on, or flush() would wait forever
+            for item in batch:
+                if item is _STOP:
+                    stopping = True
+                    continue
+                try:
+                    self._write(*item)
+                except Exception as e:
+                    print(f"❌ Error log write failed {item[1]}: {e}")
+            for path, f in list(self._files.items()):
+                try:
+                    f.flush()
+                except Exception as e:
+                    print(f"❌ Error log flush failed {path}: {e}")
+                    self._files.pop(path, None)
+            for _ in batch:
+                self._queue.task_done()
+
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_sink():
+    """The process-wide sink (every Helper writes the same files, so they share one writer)"""
+    global _shared
+    with _shared_lock:
+        if _shared is None or _shared._closed:
+            _shared = ErrorSink()
+        return _shared
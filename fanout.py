@@ -0,0 +1,102 @@
+import json
+import os
+import shutil
+
+from result_cache import task_key
+
+FANOUT_LOG = "_fanout.jsonl"
+
+
+def link_or_copy(src_path, dest_path):
+    """Make dest_path hold the same bytes as src_path: hardlink if possible, else copy.
+
+    Linked paths share one inode, so the stored JSON (incl. data.tag) is the
+    primary's. Returns True when a hardlink was used.
+    """
+    if os.path.abspath(src_path) == os.path.abspath(dest_path):
+        return True
+
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    if os.path.lexists(dest_path):
+        os.remove(dest_path)
+    try:
+        os.link(src_path, dest_path)
+        return True
+    except OSError:
+        shutil.copyfile(src_path, dest_path)
+        return False
+
+
+class Deduper:
+    """Collapses tasks that crawl the same URL with the same settings.
+
+    The first task for a key is the primary; later ones only add their tag to
+    the primary's fan-out list. Appends every new mapping to `log_path` so a
+    separate fetch process can fan results out too.
+    """
+
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self.primary_by_key = {}  # task_key -> primary tag
+        self.extra_tags = {}  # primary tag -> [other tags]
+        self.collapsed = 0
+
+    def add(self, task):
+        """Returns True if the task must be posted, False if it was folded into an earlier one"""
+        key = task_key(task)
+        primary = self.primary_by_key.get(key)
+        if primary is None:
+            self.primary_by_key[key] = task["tag"]
+            return True
+
+        if task["tag"] == primary or task["tag"] in self.extra_tags.get(primary, ()):
+            return False
+
+        self.extra_tags.setdefault(primary, []).append(task["tag"])
+        self.collapsed += 1
+        if self.log_path:
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"tag": primary, "extra": task["tag"]}) + "\n")
+        return False
+
+    def extras(self, tag):
+        return self.extra_tags.get(tag, [])
+
+    def primary(self, task):
+        """Tag of the task this one is (or would be) folded into, or None"""
+        return self.primary_by_key.get(task_key(task))
+
+
+class FanoutMap:
+    """Read side of a Deduper log: primary tag -> [extra tags]"""
+
+    def __init__(self, log_path):
+        self.extra_tags = {}
+        if not os.path.exists(log_path):
+            return
+
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                extras = self.extra_tags.setdefault(entry["tag"], [])
+                if entry["extra"] not in extras:
+                    extras.append(entry["extra"])
+
+    def extras(self, tag):
+        return self.extra_tags.get(tag, [])
+
+
+def fan_out(src_path, extra_paths):
+    """Materialize one saved result at every extra path. Returns how many were hardlinked."""
+    linked = 0
+    for dest_path in extra_paths:
+        try:
+            if link_or_copy(src_path, dest_path):
+                linked += 1
+        except OSError as e:
+            print(f"❌ Fan-out failed {dest_path}: {e}")
+    return linked
@@ -0,0 +1,255 @@
+import asyncio
+import re
+import threading
+import time
+from collections import defaultdict
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from config import USERNAME, PASSWORD
+import fastjson
+import rate_limit
+
+API_BASE = "https://api.dataforseo.com/v3"
+
+# ---------------- POOL CONFIG ----------------
+MAX_CONNECTIONS = 100  # total open sockets for the async session
+MAX_PER_HOST = 20  # keep-alive sockets per host (sync + async)
+DEFAULT_TIMEOUT = 120
+STREAM_CHUNK = 256 * 1024  # bytes per read when a body is streamed to disk
+
+DEFAULT_HEADERS = {
+    "Content-Type": "application/json",
+    "Accept-Encoding": "gzip, deflate",
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+}
+
+
+_API_STATUS_RE = re.compile(rb'"status_code"\s*:\s*(\d+)')
+
+
+def api_status_code(head):
+    """Top-level DataForSEO status_code from the first bytes of a response body"""
+    match = _API_STATUS_RE.search(head[:512])
+    return int(match.group(1)) if match else None
+
+
+def endpoint_url(path):
+    """Turn 'on_page/task_post' into a full API URL (full URLs pass through)"""
+    if path.startswith("http"):
+        return path
+    return f"{API_BASE}/{path.lstrip('/')}"
+
+
+class ClientStats:
+    """Thread-safe request counters per endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = defaultdict(int)
+        self.statuses = defaultdict(int)
+        self.errors = defaultdict(int)
+        self.seconds = defaultdict(float)
+
+    def record(self, path, status, elapsed):
+        key = endpoint_key(path)
+        with self._lock:
+            self.calls[key] += 1
+            self.seconds[key] += elapsed
+            if status is None:
+                self.errors[key] += 1
+            else:
+                self.statuses[(key, status)] += 1
+
+    def summary(self):
+        with self._lock:
+            lines = []
+            for key in sorted(self.calls):
+                calls = self.calls[key]
+                avg = self.seconds[key] / calls if calls else 0
+                codes = ", ".join(
+                    f"{status}x{count}"
+                    for (k, status), count in sorted(self.statuses.items())
+                    if k == key
+                )
+                lines.append(
+                    f"   {key}: {calls} calls, avg {avg:.2f}s, errors {self.errors[key]} [{codes}]"
+                )
+            return "\n".join(lines)
+
+
+def endpoint_key(path):
+    """Strip IDs from a path so stats group per endpoint (on_page/task_get/regular/<id>)"""
+    path = path.replace(API_BASE, "").strip("/")
+    parts = [p for p in path.split("/") if p and "-" not in p]
+    return "/".join(parts)
+
+
+stats = ClientStats()
+
+
+# ---------------- SYNC FACE ----------------
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Process-wide requests.Session with keep-alive pooling"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.auth = (USERNAME, PASSWORD)
+            session.headers.update(DEFAULT_HEADERS)
+            adapter = HTTPAdapter(
+                pool_connections=4, pool_maxsize=MAX_PER_HOST, pool_block=True
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+    return _session
+
+
+def request(method, path, headers=None, timeout=DEFAULT_TIMEOUT, **kwargs):
+    """Send a request over the shared session (rate limited) and record stats"""
+    with rate_limit.limiter_for(path).slot() as slot:
+        start = time.time()
+        try:
+            resp = get_session().request(
+                method, endpoint_url(path), headers=headers, timeout=timeout, **kwargs
+            )
+        except Exception:
+            stats.record(path, None, time.time() - start)
+            raise
+        stats.record(path, resp.status_code, time.time() - start)
+        slot.throttled = rate_limit.is_throttled(resp.status_code, api_status_code(resp.content))
+    return resp
+
+
+def post(path, payload, headers=None, timeout=DEFAULT_TIMEOUT):
+    return request("POST", path, headers=headers, timeout=timeout, json=payload)
+
+
+def get(path, headers=None, timeout=DEFAULT_TIMEOUT):
+    return request("GET", path, headers=headers, timeout=timeout)
+
+
+# ---------------- ASYNC FACE ----------------
+class AsyncClient:
+    """Pooled aiohttp session meant to be shared by every coroutine of a run.
+
+    Usage:
+        async with AsyncClient() as client:
+            status, data = await client.post_json("on_page/content_parsing", payload)
+    """
+
+    def __init__(self, limit=MAX_CONNECTIONS, limit_per_host=MAX_PER_HOST, timeout=DEFAULT_TIMEOUT):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.session = None
+
+    async def __aenter__(self):
+        self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def open(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=300,
+                keepalive_timeout=30,
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                auth=aiohttp.BasicAuth(USERNAME, PASSWORD),
+                headers=DEFAULT_HEADERS,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def request_json(self, method, path, payload=None, timeout=None, raw=False):
+        """Returns (status, body). body is parsed JSON on 200 (the unparsed bytes with raw=True), text otherwise."""
+        session = self.open()
+        kwargs = {}
+        if payload is not None:
+            kwargs["json"] = payload
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+
+        async with rate_limit.limiter_for(path).slot_async() as slot:
+            start = time.time()
+            try:
+                async with session.request(method, endpoint_url(path), **kwargs) as response:
+                    if response.status == 200 and raw:
+                        body = await response.read()
+                        api_status = api_status_code(body)
+                    elif response.status == 200:
+                        body = fastjson.loads(await response.read())
+                        api_status = body.get("status_code") if isinstance(body, dict) else None
+                    else:
+                        body = await response.text()
+                        api_status = None
+                    stats.record(path, response.status, time.time() - start)
+                    slot.throttled = rate_limit.is_throttled(response.status, api_status)
+                    return response.status, body
+            except Exception:
+                stats.record(path, None, time.time() - start)
+                raise
+
+    async def post_to_file(self, path, payload, dest_path, timeout=None):
+        """POST and stream the raw response body into dest_path without parsing it.
+
+        Returns (status, api_status_code); the body is left for the caller
+        (e.g. a process pool) to decode.
+        """
+        session = self.open()
+        kwargs = {"json": payload}
+        if timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+
+        loop = asyncio.get_running_loop()
+        async with rate_limit.limiter_for(path).slot_async() as slot:
+            start = time.time()
+            try:
+                async with session.request("POST", endpoint_url(path), **kwargs) as response:
+                    head = b""
+                    # Disk writes run in the executor, STREAM_CHUNK bytes at a time, so the loop never blocks on I/O
+                    f = await loop.run_in_executor(None, open, dest_path, "wb")
+                    try:
+                        pending, size = [], 0
+                        async for chunk in response.content.iter_chunked(STREAM_CHUNK):
+                            if len(head) < 512:
+                                head += chunk[:512]
+                            pending.append(chunk)
+                            size += len(chunk)
+                            if size >= STREAM_CHUNK:
+                                await loop.run_in_executor(None, f.writelines, pending)
+                                pending, size = [], 0
+                        if pending:
+                            await loop.run_in_executor(None, f.writelines, pending)
+                    finally:
+                        await loop.run_in_executor(None, f.close)
+                    api_status = api_status_code(head) if response.status == 200 else None
+                    stats.record(path, response.status, time.time() - start)
+                    slot.throttled = rate_limit.is_throttled(response.status, api_status)
+                    return response.status, api_status
+            except Exception:
+                stats.record(path, None, time.time() - start)
+                raise
+
+    async def post_json(self, path, payload, timeout=None, raw=False):
+        return await self.request_json("POST", path, payload=payload, timeout=timeout, raw=raw)
+
+    async def get_json(self, path, timeout=None):
+        return await self.request_json("GET", path, timeout=timeout)
@@ -0,0 +1,226 @@
+import csv
+import os
+import sqlite3
+import threading
+import time
+
+import passthrough
+
+LEDGER_PATH = "_ledger.sqlite"
+
+# ---------------- STATES ----------------
+SERP_SEEN = "serp_seen"  # row read from a serp_outputs CSV
+POSTED = "posted"  # task_post accepted it (task_id set)
+READY = "ready"  # tasks_ready reported the task
+FETCHED = "fetched"  # result (or metadata file) saved
+LOW_QUALITY = "low_quality"  # saved but too weak, queued for rescue
+RESCUED = "rescued"  # re-crawled with rescue settings
+FAILED = "failed"  # API / crawl error, see `error`
+
+IN_FLIGHT = (POSTED, READY)
+DONE = (FETCHED, LOW_QUALITY, RESCUED)
+
+JOB_COLUMNS = ("suburb", "service", "type", "rank_group", "rank_absolute", "url", "domain", "tag")
+
+
+class Ledger:
+    """One row per (suburb, service, type, rank, url) work item and its state.
+
+    Replaces parsing_progress.json and directory rescans as the source of truth:
+    every stage picks up its work with one indexed query on `state`. Stored in
+    SQLite (WAL); thread-safe, one instance can be shared by a whole run.
+    """
+
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY, suburb TEXT, service TEXT, type TEXT,"
+            " rank_group TEXT, rank_absolute TEXT, url TEXT, domain TEXT, tag TEXT,"
+            " state TEXT NOT NULL, task_id TEXT, size INTEGER, attempts INTEGER DEFAULT 0,"
+            " error TEXT, updated_at REAL,"
+            " UNIQUE (suburb, service, type, rank_absolute, url));"
+            "CREATE INDEX IF NOT EXISTS idx_jobs_state ON jobs(state);"
+            "CREATE INDEX IF NOT EXISTS idx_jobs_suburb ON jobs(suburb);"
+            "CREATE INDEX IF NOT EXISTS idx_jobs_tag ON jobs(tag);"
+            "CREATE INDEX IF NOT EXISTS idx_jobs_task ON jobs(task_id);"
+            "CREATE TABLE IF NOT EXISTS sources (name TEXT PRIMARY KEY, kind TEXT, ingested_at REAL);"
+        )
+        self._conn.commit()
+
+    # ---------------- WRITES ----------------
+    def add_rows(self, rows, state=SERP_SEEN):
+        """Insert normalized rows (dicts with JOB_COLUMNS); existing work items are left alone"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR IGNORE INTO jobs ({', '.join(JOB_COLUMNS)}, state, updated_at)"
+                f" VALUES ({', '.join('?' * len(JOB_COLUMNS))}, ?, ?)",
+                [tuple(str(row.get(c) or "") for c in JOB_COLUMNS) + (state, now) for row in rows],
+            )
+            self._conn.commit()
+
+    def mark_posted(self, pairs):
+        """pairs of (tag, task_id) from a task_post response"""
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET state = ?, task_id = ?, attempts = attempts + 1, error = NULL,"
+                " updated_at = ? WHERE tag = ?",
+                [(POSTED, task_id, now, tag) for tag, task_id in pairs],
+            )
+            self._conn.commit()
+
+    def mark_ready(self, task_ids):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET state = ?, updated_at = ? WHERE task_id = ? AND state = ?",
+                [(READY, now, task_id, POSTED) for task_id in task_ids],
+            )
+            self._conn.commit()
+
+    def set_state(self, tags, state, size=None, error=None):
+        """Move every row of `tags` (a tag or a list of tags) to `state`"""
+        if isinstance(tags, str):
+            tags = [tags]
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE jobs SET state = ?, size = COALESCE(?, size), error = ?, updated_at = ?"
+                " WHERE tag = ?",
+                [(state, size, error, now, tag) for tag in tags],
+            )
+            self._conn.commit()
+
+    def reset(self):
+        """Forget posting progress: every row back to serp_seen and CSVs re-read on next ingest"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, task_id = NULL, attempts = 0, error = NULL", (SERP_SEEN,)
+            )
+            self._conn.execute("DELETE FROM sources")
+            self._conn.commit()
+
+    # ---------------- INGEST ----------------
+    def is_ingested(self, name):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM sources WHERE name = ?", (name,)).fetchone() is not None
+
+    def mark_ingested(self, name, kind):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sources (name, kind, ingested_at) VALUES (?, ?, ?)",
+                (name, kind, time.time()),
+            )
+            self._conn.commit()
+
+    def ingest_serp_folder(self, helper, folder="serp_outputs", on_meta=None):
+        """Add the rows of every not yet ingested SERP CSV. Returns the number of new CSVs.
+
+        `helper` is a base.Helper (row normalization + tags). Rows without a
+        crawlable URL are handed to on_meta(row, row_data) and marked fetched.
+        """
+        if not os.path.exists(folder):
+            return 0
+
+        new_files = 0
+        for csv_filename in sorted(f for f in os.listdir(folder) if f.endswith(".csv")):
+            if self.is_ingested(csv_filename):
+                continue
+
+            rows, meta_tags = [], []
+            with open(os.path.join(folder, csv_filename), mode="r", encoding="utf-8") as file:
+                for row in csv.DictReader(file):
+                    row_data = helper.normalize_row(row)
+                    row_data["tag"] = helper.tag_for_row(row_data)
+                    rows.append(row_data)
+                    if helper.build_onpage_task(row_data) is None:
+                        if on_meta:
+                            on_meta(row, row_data)
+                        meta_tags.append(row_data["tag"])
+
+            self.add_rows(rows)
+            self.set_state(meta_tags, FETCHED)
+            self.mark_ingested(csv_filename, "serp")
+            new_files += 1
+            print(f"📒 Ledger: {csv_filename} ({len(rows)} rows)")
+        return new_files
+
+    def ingest_task_files(self, folder="queued_tasks"):
+        """Mark rows posted from saved task_post responses (covers runs that predate the ledger)"""
+        if not os.path.exists(folder):
+            return 0
+
+        pairs = []
+        for file_name in sorted(os.listdir(folder)):
+            if not file_name.endswith(".json") or file_name.startswith("_") or self.is_ingested(file_name):
+                continue
+            try:
+                # Streamed: posted-task files can be large (every task echoes its full payload)
+                for task in passthrough.iter_file_tasks(os.path.join(folder, file_name)):
+                    tag = task.data.get("tag")
+                    if task.status_code == 20100 and tag and task.id:
+                        pairs.append((tag, task.id))
+            except (OSError, ValueError) as e:
+                print(f"❌ Error reading {file_name}: {e}")
+                continue
+            self.mark_ingested(file_name, "tasks")
+
+        if pairs:
+            # Only rows that are not already further along
+            with self._lock:
+                self._conn.executemany(
+                    "UPDATE jobs SET state = ?, task_id = ?, attempts = MAX(attempts, 1), updated_at = ?"
+                    " WHERE tag = ? AND state = ?",
+                    [(POSTED, task_id, time.time(), tag, SERP_SEEN) for tag, task_id in pairs],
+                )
+                self._conn.commit()
+        return len(pairs)
+
+    # ---------------- QUERIES ----------------
+    def rows(self, states, suburb=None, updated_before=None):
+        """Work items in any of `states` (oldest first) as dicts keyed like normalized rows.
+
+        updated_before: only rows whose state has not changed since that time.time().
+        """
+        if isinstance(states, str):
+            states = [states]
+        sql = f"SELECT * FROM jobs WHERE state IN ({', '.join('?' * len(states))})"
+        params = list(states)
+        if suburb is not None:
+            sql += " AND suburb = ?"
+            params.append(suburb)
+        if updated_before is not None:
+            sql += " AND updated_at < ?"
+            params.append(updated_before)
+        with self._lock:
+            return [dict(row) for row in self._conn.execute(sql + " ORDER BY id", params).fetchall()]
+
+    def iter_rows(self, states, page_size=1000):
+        """Same as rows() but fetched page by page (keyset on id), so memory stays flat on big ledgers"""
+        if isinstance(states, str):
+            states = [states]
+        sql = (f"SELECT * FROM jobs WHERE state IN ({', '.join('?' * len(states))}) AND id > ?"
+               f" ORDER BY id LIMIT {int(page_size)}")
+        last_id = 0
+        while True:
+            with self._lock:
+                page = [dict(row) for row in self._conn.execute(sql, [*states, last_id]).fetchall()]
+            yield from page
+            if len(page) < page_size:
+                return
+            last_id = page[-1]["id"]
+
+    def counts(self):
+        with self._lock:
+            return dict(self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,22 +1,15 @@
+import argparse
 import csv
 import os
 import asyncio
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
-from dataforseo_client import configuration as dfs_config
-from dataforseo_client import api_client as dfs_api_provider
-from dataforseo_client.api.serp_api import SerpApi
-from dataforseo_client.rest import ApiException
-from config import USERNAME, PASSWORD
+import http_client
+import task_watcher
 
 
 # ---------------- CONFIG ----------------
-configuration = dfs_config.Configuration(
-    username=USERNAME,
-    password=PASSWORD
-)
-
 OUTPUT_DIR = "serp_outputs"
 FIELDNAMES = [
     'rank_group', 'rank_absolute',
@@ -25,104 +18,268 @@ FIELDNAMES = [
     'description', 'type'
 ]
 
-MAX_WORKERS = 5  # 🔥 tune this (depends on your API limits)
+MAX_CONCURRENT = 5  # 🔥 tune this (requests in flight; rate is capped by rate_limit "serp_live")
+SERP_ENDPOINT = "serp/google/organic/live/advanced"  # limiter family: serp_live
+
+# Standard (queued) mode: up to 100 keywords per task_post, collected via tasks_ready
+SERP_TASK_POST = "serp/google/organic/task_post"
+SERP_TASKS_READY = "serp/google/organic/tasks_ready"
+SERP_TASK_GET = "serp/google/organic/task_get/advanced/{}"
+STANDARD_BATCH_SIZE = 100
+SERP_TASK_PENDING_CODES = (40601, 40602)  # Task Handed / Task in Queue
+
+
+# ---------------- HELPERS ----------------
+def iter_list_rows(list_csv="list.csv"):
+    """Lazily yield (service, suburb) pairs from list.csv"""
+    with open(list_csv, mode='r', encoding='utf-8') as infile:
+        for row in csv.DictReader(infile):
+            suburb = (row.get('Suburb') or row.get('suburb') or "").strip()
+            service = (row.get('service') or row.get('Service') or "").strip()
+
+            if suburb and service:
+                yield service, suburb
+
+
+def build_post_data(service, suburb):
+    return {
+        "keyword": f"{service} in {suburb}",
+        "location_name": "Australia",
+        "language_name": "English",
+        "device": "mobile",
+        "os": "ios",
+        "depth": 20
+    }
+
+
+def serp_rows(service, suburb, items):
+    """Map raw SERP items to FIELDNAMES rows"""
+    for item in items:
+        yield {
+            'rank_group': item.get('rank_group', ''),
+            'rank_absolute': item.get('rank_absolute', ''),
+            'service': service,
+            'suburb': suburb,
+            'title': item.get('title', ''),
+            'domain': item.get('domain', ''),
+            'url': item.get('url', ''),
+            'description': item.get('description', ''),
+            'type': item.get('type', '')
+        }
+
 
+def write_serp_csv(service, suburb, items):
+    """Write one serp_outputs CSV. Returns the file name."""
+    now = datetime.now().strftime("%Y%m%d_%H%M%S")
+    sub_clean = suburb.replace(' ', '-')
+    ser_clean = service.replace(' ', '-')
+
+    file_name = f"serp_{ser_clean}_{sub_clean}_{now}.csv"
+    file_path = os.path.join(OUTPUT_DIR, file_name)
+
+    with open(file_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(serp_rows(service, suburb, items))
+
+    return file_name
+
+
+def task_items(task):
+    """Items of a SERP task, or None when the task has no usable result"""
+    if task.get("status_message") != "Ok." or not task.get("result"):
+        return None
+    return task["result"][0].get("items") or []
+
+
+# ---------------- ASYNC WORKERS ----------------
+async def fetch_serp_async(client, service, suburb):
+    """POST one keyword to the live endpoint. Returns the raw items or None."""
+    print(f"🚀 Searching: {service} in {suburb}")
 
-# ---------------- SYNC WORKER ----------------
-def fetch_and_save_serp(service, suburb):
-    """Runs inside thread pool"""
     try:
-        now = datetime.now().strftime("%Y%m%d_%H%M%S")
-        sub_clean = suburb.replace(' ', '-')
-        ser_clean = service.replace(' ', '-')
-
-        file_name = f"serp_{ser_clean}_{sub_clean}_{now}.csv"
-        file_path = os.path.join(OUTPUT_DIR, file_name)
-
-        print(f"🚀 Searching: {service} in {suburb}")
-
-        with dfs_api_provider.ApiClient(configuration) as api_client:
-            serp_api = SerpApi(api_client)
-
-            post_data = [{
-                "keyword": f"{service} in {suburb}",
-                "location_name": "Australia",
-                "language_name": "English",
-                "device": "mobile",
-                "os": "ios",
-                "depth": 20
-            }]
-
-            response = serp_api.google_organic_live_advanced(post_data)
-
-            if not response.tasks:
-                print(f"❌ No task result for {suburb}")
-                return
-
-            task = response.tasks[0]
-            if task.status_message != "Ok." or not task.result:
-                print(f"❌ No results for {suburb}")
-                return
-
-            items = task.result[0].items or []
-
-            with open(file_path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
-                writer.writeheader()
-
-                for item in items:
-                    writer.writerow({
-                        'rank_group': getattr(item, 'rank_group', ''),
-                        'rank_absolute': getattr(item, 'rank_absolute', ''),
-                        'service': service,
-                        'suburb': suburb,
-                        'title': getattr(item, 'title', ''),
-                        'domain': getattr(item, 'domain', ''),
-                        'url': getattr(item, 'url', ''),
-                        'description': getattr(item, 'description', ''),
-                        'type': getattr(item, 'type', '')
-                    })
-
-        print(f"✅ Saved: {file_name}")
-
-    except ApiException as e:
-        print(f"🚫 API Error ({suburb}): {e}")
+        status, res = await client.post_json(SERP_ENDPOINT, [build_post_data(service, suburb)])
     except Exception as e:
         print(f"🔥 Error ({suburb}): {e}")
+        return None
+
+    if status != 200:
+        print(f"🚫 API Error ({suburb}): {status} - {res}")
+        return None
+
+    if not res.get("tasks"):
+        print(f"❌ No task result for {suburb}")
+        return None
+
+    items = task_items(res["tasks"][0])
+    if items is None:
+        print(f"❌ No results for {suburb}")
+    return items
+
+
+async def serp_writer(results):
+    """Single writer: drains (service, suburb, items) and writes CSVs off the event loop"""
+    loop = asyncio.get_running_loop()
+    saved = 0
+    while True:
+        result = await results.get()
+        if result is None:
+            return saved
+
+        service, suburb, items = result
+        try:
+            file_name = await loop.run_in_executor(None, write_serp_csv, service, suburb, items)
+            print(f"✅ Saved: {file_name}")
+            saved += 1
+        except Exception as e:
+            print(f"🔥 Write Error ({suburb}): {e}")
+
+
+async def _serp_worker(client, jobs, results):
+    while True:
+        job = await jobs.get()
+        if job is None:
+            return
+        service, suburb = job
+        items = await fetch_serp_async(client, service, suburb)
+        if items is not None:
+            await results.put((service, suburb, items))
 
 
 # ---------------- ASYNC ORCHESTRATOR ----------------
-async def get_google_results_and_save_async(list_csv="list.csv"):
+async def get_google_results_and_save_async(list_csv="list.csv", concurrency=MAX_CONCURRENT):
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
 
-    loop = asyncio.get_running_loop()
-    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    # Bounded queues: list.csv is read only as fast as workers free up
+    jobs = asyncio.Queue(maxsize=concurrency * 2)
+    results = asyncio.Queue(maxsize=concurrency * 2)
 
-    tasks = []
+    async with http_client.AsyncClient(limit_per_host=concurrency) as client:
+        writer = asyncio.create_task(serp_writer(results))
+        workers = [
+            asyncio.create_task(_serp_worker(client, jobs, results)) for _ in range(concurrency)
+        ]
 
-    with open(list_csv, mode='r', encoding='utf-8') as infile:
-        reader = csv.DictReader(infile)
+        for job in iter_list_rows(list_csv):
+            await jobs.put(job)
+        for _ in workers:
+            await jobs.put(None)
 
-        for row in reader:
-            suburb = (row.get('Suburb') or row.get('suburb') or "").strip()
-            service = (row.get('service') or row.get('Service') or "").strip()
+        await asyncio.gather(*workers)
+        await results.put(None)
+        saved = await writer
+
+    print(f"🎉 Saved {saved} SERP files")
+    print(f"📈 API stats:\n{http_client.stats.summary()}")
+
+
+# ---------------- STANDARD QUEUE MODE ----------------
+async def post_serp_tasks(client, watcher, list_csv="list.csv", batch_size=STANDARD_BATCH_SIZE):
+    """Post list.csv in task_post batches and register every created task"""
+    rows = iter_list_rows(list_csv)
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+
+            payload = [
+                dict(build_post_data(service, suburb), tag=f"{service}|{suburb}")
+                for service, suburb in batch
+            ]
+            print(f"📡 Posting {len(payload)} keywords (standard queue)...")
+            try:
+                status, res = await client.post_json(SERP_TASK_POST, payload)
+            except Exception as e:
+                print(f"🔥 Post Error: {e}")
+                continue
 
-            if not suburb or not service:
+            if status != 200:
+                print(f"🚫 API Error: {status} - {res}")
                 continue
 
-            task = loop.run_in_executor(
-                executor,
-                fetch_and_save_serp,
-                service,
-                suburb
-            )
-            tasks.append(task)
+            for task in res.get("tasks", []):
+                tid = task.get("id")
+                tag = (task.get("data") or {}).get("tag")
+                if task.get("status_code") == 20100 and tid and tag:
+                    service, suburb = tag.split("|", 1)
+                    watcher.watch(tid, None, tag, meta=(service, suburb))
+                else:
+                    print(f"❌ Task not created for {tag}: {task.get('status_message')}")
+    finally:
+        watcher.close()
 
-    await asyncio.gather(*tasks)
-    executor.shutdown(wait=True)
+
+async def _standard_fetch_worker(watcher, results):
+    while True:
+        entry = await watcher.queue.get()
+        if entry is None:
+            return
+
+        tid = entry["id"]
+        service, suburb = entry["meta"]
+        try:
+            status, res = await watcher.client.get_json(SERP_TASK_GET.format(tid))
+        except Exception as e:
+            print(f"🔥 Error ({suburb}): {e}")
+            status, res = None, None
+
+        task = (res.get("tasks") or [{}])[0] if status == 200 else {}
+        if status != 200 or task.get("status_code") in SERP_TASK_PENDING_CODES:
+            if not watcher.retry(tid):
+                watcher.resolve(tid)
+                print(f"⌛ Gave up on {suburb} after {watcher.max_wait}s")
+            continue
+
+        watcher.resolve(tid)
+        items = task_items(task)
+        if items is None:
+            print(f"❌ No results for {suburb}")
+            continue
+        await results.put((service, suburb, items))
+
+
+async def get_google_results_standard_async(list_csv="list.csv", concurrency=MAX_CONCURRENT,
+                                            batch_size=STANDARD_BATCH_SIZE):
+    """task_post (100 keywords per call) → tasks_ready → task_get, same CSV output as live mode"""
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
+
+    results = asyncio.Queue(maxsize=concurrency * 2)
+
+    async with http_client.AsyncClient(limit_per_host=concurrency) as client:
+        watcher = task_watcher.CompletionWatcher(
+            client, poll_interval=10, probe_after=600, max_wait=3600,
+            ready_endpoint=SERP_TASKS_READY,
+        )
+        writer = asyncio.create_task(serp_writer(results))
+        fetchers = [
+            asyncio.create_task(_standard_fetch_worker(watcher, results)) for _ in range(concurrency)
+        ]
+
+        await asyncio.gather(
+            post_serp_tasks(client, watcher, list_csv, batch_size),
+            watcher.run(consumers=concurrency),
+        )
+        await asyncio.gather(*fetchers)
+        await results.put(None)
+        saved = await writer
+
+    print(f"🎉 Saved {saved} SERP files")
+    print(f"📈 API stats:\n{http_client.stats.summary()}")
 
 
 # ---------------- ENTRY POINT ----------------
 if __name__ == "__main__":
-    asyncio.run(get_google_results_and_save_async())
+    parser = argparse.ArgumentParser(description="Collect Google SERP results for list.csv")
+    parser.add_argument("--mode", choices=["live", "standard"], default="live",
+                        help="live: one keyword per request; standard: 100 keywords per task_post (cheaper, queued)")
+    parser.add_argument("--list", default="list.csv", help="CSV with Suburb,service columns")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT)
+    args = parser.parse_args()
+
+    if args.mode == "standard":
+        asyncio.run(get_google_results_standard_async(args.list, args.concurrency))
+    else:
+        asyncio.run(get_google_results_and_save_async(args.list, args.concurrency))
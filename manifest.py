@@ -0,0 +1,291 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import fastjson
+import quality
+import storage
+from passthrough import RawTask
+
+MANIFEST_PATH = "_manifest.sqlite"
+
+HEAD_BYTES = 16 * 1024  # data + crawl_status sit before page content in a saved result (decompressed)
+
+_RG_RE = re.compile(r"_rg(\d+)")
+_RA_RE = re.compile(r"_ra(\d+)")
+_URL_RE = re.compile(rb'"(?:start_url|url)"\s*:\s*"([^"]*)"')
+_PROGRESS_RE = re.compile(rb'"crawl_progress"\s*:\s*"([^"]*)"')
+_PAGES_RE = re.compile(rb'"pages_crawled"\s*:\s*(\d+)')
+
+COLUMNS = (
+    "rel_path", "size", "mtime_ns", "url", "rank_group", "rank_absolute", "type", "suburb",
+    "crawl_progress", "pages_crawled", "hash", "words", "headings", "status_code", "quality",
+)
+
+
+def _root_key(root):
+    return os.path.normpath(root)
+
+
+def result_meta(task_result, stored=None):
+    """Index fields of a task result, taken by writers from the dict they are saving.
+
+    Quality (quality.evaluate) is scored here, once, at save time. With the
+    `stored` bytes that were written, the hash is computed here too and the
+    file is not read back. A passthrough.RawTask is scored from its bytes, unparsed.
+    """
+    data = task_result.get("data") or {}
+    if isinstance(task_result, RawTask):
+        progress, pages = task_result.crawl_progress, task_result.pages_crawled
+        metrics = quality.evaluate_raw(task_result)
+    else:
+        result = (task_result.get("result") or [{}])[0] or {}
+        progress, pages = result.get("crawl_progress"), (result.get("crawl_status") or {}).get("pages_crawled")
+        metrics = quality.evaluate(task_result)
+    meta = {
+        "url": data.get("start_url") or data.get("url") or "",
+        "crawl_progress": progress,
+        "pages_crawled": pages,
+    }
+    meta.update(metrics)
+    if stored is not None:
+        meta["hash"] = hashlib.sha1(stored).hexdigest()
+    return meta
+
+
+def head_meta(content):
+    """Same fields read from the first bytes of a saved result, without parsing it"""
+    # Only saved API results carry a crawled URL (metadata rows start with "# Type")
+    meta = dict.fromkeys(quality.FIELDS)
+    if not storage.is_result(content):
+        return dict(meta, url="", crawl_progress=None, pages_crawled=None)
+
+    head = storage.head(content, HEAD_BYTES)
+    url = _URL_RE.search(head)
+    progress = _PROGRESS_RE.search(head)
+    pages = _PAGES_RE.search(head)
+    return dict(
+        meta,
+        url=url.group(1).decode("utf-8", "replace") if url else "",
+        crawl_progress=progress.group(1).decode() if progress else None,
+        pages_crawled=int(pages.group(1)) if pages else None,
+    )
+
+
+def content_meta(content):
+    """Index fields of a file written without result_meta (legacy trees, cache hits): parsed once"""
+    if storage.is_result(content):
+        try:
+            return result_meta(fastjson.loads(storage.decode_bytes(content)))
+        except (ValueError, RuntimeError):
+            pass  # truncated / unreadable: url and crawl status from the head, no quality
+    return head_meta(content)
+
+
+def _rank(pattern, file_name):
+    match = pattern.search(file_name)
+    return int(match.group(1)) if match else None
+
+
+def file_meta(root, file_path, st=None, meta=None):
+    """Manifest row for one file (see COLUMNS); `meta` comes from result_meta() when the writer has it"""
+    st = st or os.stat(file_path)
+    rel_path = os.path.relpath(file_path, root)
+    parts = rel_path.split(os.sep)
+    suburb = parts[0] if len(parts) > 1 else ""
+    item_type = parts[1] if len(parts) > 2 else ""
+
+    if meta is None or "hash" not in meta:
+        with open(file_path, "rb") as f:
+            content = f.read()
+        meta = dict(meta or content_meta(content), hash=hashlib.sha1(content).hexdigest())
+
+    return (rel_path, st.st_size, st.st_mtime_ns, meta["url"],
+            _rank(_RG_RE, parts[-1]), _rank(_RA_RE, parts[-1]), item_type, suburb,
+            meta["crawl_progress"], meta["pages_crawled"], meta["hash"],
+            meta.get("words"), meta.get("headings"), meta.get("status_code"), meta.get("quality"))
+
+
+class Manifest:
+    """Persistent index of every output file (path, size, mtime, url, rank, type, suburb, crawl status,
+    hash and content quality).
+
+    Writers call `record()` after saving; `refresh()` catches up with anything
+    else using os.scandir and (size, mtime) comparison, so only new or changed
+    files are read. Audit and rescue scripts query `files()` instead of os.walk.
+    Files and folders starting with "_" (reports, logs) are not indexed.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " root TEXT, rel_path TEXT, size INTEGER, mtime_ns INTEGER, url TEXT,"
+            " rank_group INTEGER, rank_absolute INTEGER, type TEXT, suburb TEXT,"
+            " crawl_progress TEXT, pages_crawled INTEGER, hash TEXT,"
+            " words INTEGER, headings INTEGER, status_code INTEGER, quality TEXT,"
+            " PRIMARY KEY (root, rel_path));"
+            "CREATE INDEX IF NOT EXISTS idx_files_size ON files(root, size);"
+            "CREATE INDEX IF NOT EXISTS idx_files_suburb ON files(root, suburb);"
+        )
+        # Manifests created before rank/crawl status/quality were indexed
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+        for column, kind in (("rank_absolute", "INTEGER"), ("crawl_progress", "TEXT"), ("pages_crawled", "INTEGER"),
+                             ("words", "INTEGER"), ("headings", "INTEGER"), ("status_code", "INTEGER"),
+                             ("quality", "TEXT")):
+            if column not in existing:
+                self._conn.execute(f"ALTER TABLE files ADD COLUMN {column} {kind}")
+                self._conn.execute("UPDATE files SET mtime_ns = 0")  # re-read on next refresh
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_files_quality ON files(root, quality)")
+        # Verdicts scored by an older quality.py
+        if self._conn.execute("PRAGMA user_version").fetchone()[0] < quality.VERSION:
+            self._conn.execute("UPDATE files SET mtime_ns = 0")
+            self._conn.execute(f"PRAGMA user_version = {int(quality.VERSION)}")
+        self._conn.commit()
+
+    def _upsert(self, root, metas):
+        self._conn.executemany(
+            f"INSERT OR REPLACE INTO files (root, {', '.join(COLUMNS)})"
+            f" VALUES (?, {', '.join('?' * len(COLUMNS))})",
+            [(root,) + meta for meta in metas],
+        )
+
+    def record(self, root, file_paths, meta=None):
+        """Index freshly written file(s) under `root` (a path or a list of paths).
+
+        Pass `meta=result_meta(task_result)` to store url / crawl status without re-reading them.
+        """
+        if isinstance(file_paths, str):
+            file_paths = [file_paths]
+        self.record_each(root, [(file_path, meta) for file_path in file_paths])
+
+    def record_each(self, root, items):
+        """Index many (file_path, meta) pairs under `root` in one transaction"""
+        metas = []
+        for file_path, meta in items:
+            try:
+                metas.append(file_meta(root, file_path, meta=meta))
+            except OSError as e:
+                print(f"⚠️ Manifest skip {file_path}: {e}")
+        with self._lock:
+            self._upsert(_root_key(root), metas)
+            self._conn.commit()
+
+    def _scan(self, directory):
+        """Yield (path, stat) for every indexable file below directory"""
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.name.startswith("_"):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from self._scan(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry.path, entry.stat(follow_symlinks=False)
+
+    def refresh(self, root):
+        """Bring the manifest for `root` up to date. Returns (changed, removed) counts."""
+        key = _root_key(root)
+        with self._lock:
+            known = {
+                rel_path: (size, mtime_ns)
+                for rel_path, size, mtime_ns in self._conn.execute(
+                    "SELECT rel_path, size, mtime_ns FROM files WHERE root = ?", (key,)
+                )
+            }
+
+        metas = []
+        seen = set()
+        start = time.time()
+        for file_path, st in self._scan(root):
+            rel_path = os.path.relpath(file_path, root)
+            seen.add(rel_path)
+            if known.get(rel_path) == (st.st_size, st.st_mtime_ns):
+                continue
+            try:
+                metas.append(file_meta(root, file_path, st))
+            except OSError:
+                continue
+
+        removed = [(key, rel_path) for rel_path in known if rel_path not in seen]
+        with self._lock:
+            self._upsert(key, metas)
+            self._conn.executemany("DELETE FROM files WHERE root = ? AND rel_path = ?", removed)
+            self._conn.commit()
+
+        print(f"🗂️ Manifest {root}: {len(seen)} files, {len(metas)} changed, "
+              f"{len(removed)} removed ({time.time() - start:.1f}s)")
+        return len(metas), len(removed)
+
+    def files(self, root, suffix=None, max_size=None, type_contains=None, low_quality=False):
+        """Indexed files under `root` as dicts (with `path` joined back onto root).
+
+        low_quality=True keeps only results whose quality verdict is in quality.LOW_QUALITY.
+        """
+        sql = "SELECT * FROM files WHERE root = ?"
+        params = [_root_key(root)]
+        if suffix:
+            sql += " AND rel_path LIKE ?"
+            params.append(f"%{suffix}")
+        if max_size is not None:
+            sql += " AND size < ?"
+            params.append(max_size)
+        if type_contains:
+            sql += " AND type LIKE ?"
+            params.append(f"%{type_contains}%")
+        if low_quality:
+            sql += f" AND quality IN ({', '.join('?' * len(quality.LOW_QUALITY))})"
+            params.extend(quality.LOW_QUALITY)
+
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY rel_path", params).fetchall()
+        return [dict(row, path=os.path.join(root, row["rel_path"])) for row in rows]
+
+    def iter_files(self, root, suffix=None, page_size=1000):
+        """Same rows as files(root, suffix) fetched page by page (keyset on rel_path), so memory stays flat"""
+        sql = "SELECT * FROM files WHERE root = ? AND rel_path > ?"
+        if suffix:
+            sql += " AND rel_path LIKE ?"
+        sql += f" ORDER BY rel_path LIMIT {int(page_size)}"
+        last = ""
+        while True:
+            params = [_root_key(root), last] + ([f"%{suffix}"] if suffix else [])
+            with self._lock:
+                page = self._conn.execute(sql, params).fetchall()
+            for row in page:
+                yield dict(row, path=os.path.join(root, row["rel_path"]))
+            if len(page) < page_size:
+                return
+            last = page[-1]["rel_path"]
+
+    def get(self, root, file_path):
+        """Row of one indexed file as a dict, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM files WHERE root = ? AND rel_path = ?",
+                (_root_key(root), os.path.relpath(file_path, root)),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def count(self, root, suffix=None):
+        sql = "SELECT COUNT(*) FROM files WHERE root = ?"
+        params = [_root_key(root)]
+        if suffix:
+            sql += " AND rel_path LIKE ?"
+            params.append(f"%{suffix}")
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,199 @@
+import argparse
+import csv
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import manifest
+import storage
+
+DEFAULT_ROOTS = ["parsed_content_markdowns", "FINAL_DATABASE"]
+WORKERS = os.cpu_count() or 4
+BATCH_SIZE = 32  # results per pool job
+WINDOW = 4  # batches in flight per worker
+STATS_CSV = "_markdown_stats.csv"
+STATS_FIELDS = ["file_path", "url", "words", "headings", "h1", "h2", "h3", "h4", "h5", "h6"]
+
+
+# ---------------- CONVERSION ----------------
+def page_content_of(task_result):
+    """items[0].page_content of a content_parsing result ({} when missing)"""
+    result = (task_result.get("result") or [{}])[0] or {}
+    items = result.get("items") or [{}]
+    return (items[0] or {}).get("page_content") or {}
+
+
+def iter_blocks(page_content):
+    """Yield (level, text) in document order; level 1-6 for headings, 0 for text.
+
+    Walks header → main_topic → secondary_topic → footer and every nested
+    secondary_topic with an explicit stack, so deeply nested pages cannot hit
+    the recursion limit. Both primary_content and secondary_content are text.
+    """
+    topics = [page_content.get("header") or {}] + list(page_content.get("main_topic") or [])
+    topics.extend(page_content.get("secondary_topic") or [])
+    topics.append(page_content.get("footer") or {})
+    stack = topics[::-1]
+    while stack:
+        topic = stack.pop()
+        title = (topic.get("h_title") or "").strip()
+        if title:
+            try:
+                level = min(max(int(topic.get("level") or 2), 1), 6)
+            except (TypeError, ValueError):
+                level = 2
+            yield level, title
+        for block in (topic.get("primary_content") or []) + (topic.get("secondary_content") or []):
+            text = (block.get("text") or "").strip()
+            if text:
+                yield 0, text
+        stack.extend(reversed(topic.get("secondary_topic") or []))
+
+
+def empty_stats():
+    return {"words": 0, "headings": 0, "h1": 0, "h2": 0, "h3": 0, "h4": 0, "h5": 0, "h6": 0}
+
+
+def convert(task_result):
+    """Clean markdown for a task result plus its word / heading stats"""
+    url = (task_result.get("data") or {}).get("start_url", "")
+    stats = empty_stats()
+    parts = [f"<!-- {url} -->"] if url else []
+
+    for level, text in iter_blocks(page_content_of(task_result)):
+        stats["words"] += len(text.split())
+        if level:
+            stats["headings"] += 1
+            stats[f"h{level}"] += 1
+            parts.append(f"{'#' * level} {text}")
+        else:
+            parts.append(text)
+    return "\n\n".join(parts) + "\n", stats
+
+
+def stats_of_markdown(markdown):
+    """Same stats read back from a rendered view (no need to load the result again)"""
+    stats = empty_stats()
+    for chunk in markdown.split("\n\n"):
+        if chunk.startswith("<!--"):
+            continue
+        level = len(chunk) - len(chunk.lstrip("#"))
+        if 1 <= level <= 6 and chunk[level:level + 1] == " ":
+            stats["headings"] += 1
+            stats[f"h{level}"] += 1
+            chunk = chunk[level:]
+        stats["words"] += len(chunk.split())
+    return stats
+
+
+# ---------------- FILES ----------------
+def view_path_for(root, rel_path):
+    return os.path.join(root, storage.VIEW_FOLDER, rel_path)
+
+
+def write_view(root, rel_path, markdown):
+    view_path = view_path_for(root, rel_path)
+    os.makedirs(os.path.dirname(view_path), exist_ok=True)
+    with open(view_path, "w", encoding="utf-8") as f:
+        f.write(markdown)
+    return view_path
+
+
+def convert_file(root, rel_path, force=False):
+    """Render one stored result to <root>/_views/<rel_path>. Returns (markdown, stats).
+
+    Skips the work when the view is already newer than the result. Top-level
+    so it can run in a process pool.
+    """
+    src_path = os.path.join(root, rel_path)
+    view_path = view_path_for(root, rel_path)
+    if not force:
+        try:
+            if os.path.getmtime(view_path) >= os.path.getmtime(src_path):
+                with open(view_path, "r", encoding="utf-8") as f:
+                    markdown = f.read()
+                return markdown, stats_of_markdown(markdown)
+        except OSError:
+            pass
+
+    markdown, stats = convert(storage.load(src_path))
+    write_view(root, rel_path, markdown)
+    return markdown, stats
+
+
+def _convert_batch(jobs):
+    """Convert a batch of (root, rel_path, url, force) jobs in a worker. Returns the stats rows."""
+    rows = []
+    for root, rel_path, url, force in jobs:
+        try:
+            _, stats = convert_file(root, rel_path, force)
+        except Exception as e:
+            print(f"❌ Convert failed {rel_path}: {e}")
+            continue
+        rows.append(dict(stats, file_path=os.path.join(root, rel_path), url=url))
+    return rows
+
+
+def iter_jobs(root, force=False):
+    """Stored results under root, paged from the manifest"""
+    index = manifest.Manifest()
+    index.refresh(root)
+    for item in index.iter_files(root, suffix=".md"):
+        if item["url"]:  # metadata rows have no page content
+            yield root, item["rel_path"], item["url"], force
+
+
+def iter_batches(jobs, size=BATCH_SIZE):
+    batch = []
+    for job in jobs:
+        batch.append(job)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def convert_tree(root, workers=WORKERS, force=False):
+    """Convert every result under root in a process pool and write <root>/_markdown_stats.csv.
+
+    At most `workers * WINDOW` batches are in flight, so jobs are read from
+    the manifest only as fast as the pool converts them.
+    """
+    if not os.path.exists(root):
+        print(f"⏭️  Skipping {root} (not found)")
+        return 0
+
+    start = time.time()
+    count = 0
+    stats_path = os.path.join(root, STATS_CSV)
+    with open(stats_path, "w", newline="", encoding="utf-8") as f, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        writer = csv.DictWriter(f, fieldnames=STATS_FIELDS)
+        writer.writeheader()
+        pending = deque()
+        for batch in iter_batches(iter_jobs(root, force)):
+            pending.append(pool.submit(_convert_batch, batch))
+            while len(pending) >= workers * WINDOW:
+                rows = pending.popleft().result()
+                writer.writerows(rows)
+                count += len(rows)
+        while pending:
+            rows = pending.popleft().result()
+            writer.writerows(rows)
+            count += len(rows)
+
+    print(f"📝 {root}: {count} markdown views in {time.time() - start:.1f}s → {stats_path}")
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render stored page_content results as markdown + stats")
+    parser.add_argument("roots", nargs="*", default=DEFAULT_ROOTS)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--force", action="store_true", help="re-render views that are up to date")
+    args = parser.parse_args()
+
+    for root in args.roots:
+        convert_tree(root, workers=args.workers, force=args.force)
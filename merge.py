@@ -1,46 +1,207 @@
-import shutil
+import hashlib
+import json
 import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import quality
+from fanout import link_or_copy
+from manifest import Manifest
+
+OLD_FOLDER = "parsed_content_markdowns"
+RETRY_FOLDER = "parsed_content_markdowns2"
+FINAL_FOLDER = "FINAL_DATABASE"
+LINK_WORKERS = min(32, (os.cpu_count() or 4) * 4)  # link/copy is I/O bound: more threads for more disks
+FSYNC = True  # flush copied files and every staged directory before publishing
+KEEP_RELEASES = 2  # published releases kept (readers may still hold the previous one)
+# Logs the ErrorSink keeps appending to: copied into a release, never hardlinked
+APPENDED_FILES = {"warning.txt", "error.txt"}
+
+# Written inside every release ("_" keeps them out of the manifest)
+RELEASE_FILE = "_release.json"
+CHECKSUMS_FILE = "_SHA1SUMS"
+
+# Better verdict wins when a file exists in both trees (lower = better); ties go to more words, then the retry
+VERDICT_RANK = {quality.OK: 0, quality.THIN: 1, quality.CHALLENGE: 2, quality.HTTP_ERROR: 2,
+                quality.NOT_CRAWLED: 3, quality.API_ERROR: 4}
+
+
+def _rank(item):
+    return VERDICT_RANK.get(item['quality'], len(VERDICT_RANK)), -(item['words'] or 0)
+
+
+def pick_better(original, retry):
+    """Row (original or retry) whose file goes into the final database"""
+    if original is None or (retry is not None and _rank(retry) <= _rank(original)):
+        return retry
+    return original
+
+
+def _fsync(path, directory=False):
+    try:
+        fd = os.open(path, os.O_RDONLY | (getattr(os, "O_DIRECTORY", 0) if directory else 0))
+    except OSError:
+        return  # directories cannot be opened on Windows
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _is_appended(rel_path):
+    return os.path.basename(rel_path) in APPENDED_FILES
+
+
+def _sha1(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _stage_one(staging, src_path, rel_path):
+    """Link (or copy) one file into the staging tree.
+
+    Appended logs are copied: a hardlink would let later appends change the
+    published release under its _SHA1SUMS.
+    """
+    dst_path = os.path.join(staging, rel_path)
+    if _is_appended(rel_path):
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        shutil.copyfile(src_path, dst_path)
+        linked = False
+    else:
+        linked = link_or_copy(src_path, dst_path)
+    if not linked and FSYNC:
+        _fsync(dst_path)  # hardlinks share already-written data; copies need flushing
+    return dst_path
+
+
+def publish(staging, final_folder):
+    """Point final_folder at staging in one atomic step (symlink swap).
+
+    A legacy real FINAL_DATABASE directory is first moved into the releases
+    folder. Where symlinks are not allowed (Windows without developer mode)
+    it falls back to two renames.
+    """
+    if os.path.isdir(final_folder) and not os.path.islink(final_folder):
+        legacy = os.path.join(os.path.dirname(staging), f"legacy-{int(time.time())}")
+        os.rename(final_folder, legacy)
+        print(f"📦 Moved existing {final_folder} to {legacy}")
+
+    tmp_link = f"{final_folder}.tmp-link"
+    try:
+        if os.path.lexists(tmp_link):
+            os.remove(tmp_link)
+        target = os.path.relpath(staging, os.path.dirname(os.path.abspath(final_folder)))
+        os.symlink(target, tmp_link, target_is_directory=True)
+        os.replace(tmp_link, final_folder)
+    except OSError as e:
+        print(f"⚠️ Symlink swap not possible ({e}), publishing by rename")
+        if os.path.lexists(final_folder):
+            os.rename(final_folder, f"{staging}.previous")
+        os.rename(staging, final_folder)
+
+
+def _prune_releases(releases_folder, final_folder, keep):
+    current = os.path.realpath(final_folder)
+    releases = sorted(
+        (e.path for e in os.scandir(releases_folder) if e.is_dir(follow_symlinks=False)),
+        key=os.path.getmtime,
+    )
+    for path in releases[:-keep] if keep else releases:
+        if os.path.realpath(path) != current:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def create_final_database(old_folder=OLD_FOLDER, retry_folder=RETRY_FOLDER, final_folder=FINAL_FOLDER):
+    """Build the merged tree in a staging release and publish it atomically.
+
+    Unchanged files are hardlinked from the current release, new/changed ones
+    from their source tree; readers of final_folder only ever see a complete merge.
+    """
+    start = time.time()
+    if not os.path.exists(old_folder) and not os.path.exists(retry_folder):
+        print(f"⏭️  Nothing to merge ({old_folder} and {retry_folder} not found)")
+        return
+
+    releases_folder = f"{final_folder}_releases"
+    staging = os.path.join(releases_folder, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+    os.makedirs(staging)
+
+    # File lists come from the manifest ("_" reports/summaries are not indexed); the three trees are walked in parallel
+    manifest = Manifest()
+    roots = [r for r in (old_folder, retry_folder, final_folder) if os.path.exists(r)]
+    with ThreadPoolExecutor(max_workers=len(roots)) as pool:
+        list(pool.map(manifest.refresh, roots))
+
+    def index(root):
+        if not os.path.exists(root):
+            return {}
+        return {item['rel_path']: item for item in manifest.files(root) if not item['rel_path'].endswith(".csv")}
+
+    originals, retries, finals = index(old_folder), index(retry_folder), index(final_folder)
+
+    print("🔀 Resolving original vs retry...")
+    jobs, changed = [], []
+    from_retry = 0
+    by_quality = {}
+    for rel_path in sorted(originals.keys() | retries.keys()):
+        item = pick_better(originals.get(rel_path), retries.get(rel_path))
+        if item is retries.get(rel_path):
+            from_retry += 1
+        by_quality[item['quality'] or "metadata"] = by_quality.get(item['quality'] or "metadata", 0) + 1
+        current = finals.get(rel_path)
+        if current and current['hash'] == item['hash'] and current['size'] == item['size'] \
+                and not _is_appended(rel_path):
+            jobs.append((current['path'], rel_path, item))
+        else:
+            jobs.append((item['path'], rel_path, item))
+            changed.append(rel_path)
+
+    print(f"🔗 Staging {len(jobs)} files ({len(changed)} new/changed) in {staging}...")
+    with ThreadPoolExecutor(max_workers=LINK_WORKERS) as pool:
+        list(pool.map(lambda job: _stage_one(staging, job[0], job[1]), jobs))
+
+    # A log may have grown since the manifest read it: checksum and index the staged copy
+    for i, (src_path, rel_path, item) in enumerate(jobs):
+        if _is_appended(rel_path):
+            staged = os.path.join(staging, rel_path)
+            jobs[i] = (src_path, rel_path, dict(item, hash=_sha1(staged), size=os.path.getsize(staged)))
+
+    with open(os.path.join(staging, CHECKSUMS_FILE), "w", encoding="utf-8", newline="\n") as f:
+        for _, rel_path, item in jobs:
+            f.write(f"{item['hash']}  {rel_path.replace(os.sep, '/')}\n")
+    release = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "files": len(jobs),
+        "changed": len(changed),
+        "from_retry": from_retry,
+        "bytes": sum(item['size'] for _, _, item in jobs),
+        "by_quality": by_quality,
+        "checksums": CHECKSUMS_FILE,
+    }
+    with open(os.path.join(staging, RELEASE_FILE), "w", encoding="utf-8") as f:
+        json.dump(release, f, indent=4)
+
+    if FSYNC:
+        for dir_path, _, _ in os.walk(staging):
+            _fsync(dir_path, directory=True)
+        _fsync(os.path.join(staging, CHECKSUMS_FILE))
+        _fsync(os.path.join(staging, RELEASE_FILE))
+
+    publish(staging, final_folder)
+    _prune_releases(releases_folder, final_folder, KEEP_RELEASES)
 
-def create_final_database():
-    old_folder = "parsed_content_markdowns"
-    retry_folder = "parsed_content_markdowns2"
-    final_folder = "FINAL_DATABASE"
-
-    if not os.path.exists(final_folder):
-        os.makedirs(final_folder)
-        print(f"📂 Created folder: {final_folder}")
-
-    print("🚚 Copying initial data...")
-    if os.path.exists(old_folder):
-        for root, dirs, files in os.walk(old_folder):
-            for file in files:
-                if file == "_error_summary.csv": continue
-                
-                src_path = os.path.join(root, file)
-                rel_path = os.path.relpath(src_path, old_folder)
-                dst_path = os.path.join(final_folder, rel_path)
-                
-                os.makedirs(os.path.dirname(dst_path), exist_ok=True)
-                shutil.copy2(src_path, dst_path)
-
-    print("🛠️ Patching with fixed files...")
-    count = 0
-    if os.path.exists(retry_folder):
-        for root, dirs, files in os.walk(retry_folder):
-            for file in files:
-                if file.endswith(".csv"): continue
-                
-                src_path = os.path.join(root, file)
-                rel_path = os.path.relpath(src_path, retry_folder)
-                dst_path = os.path.join(final_folder, rel_path)
-                
-                os.makedirs(os.path.dirname(dst_path), exist_ok=True)
-                shutil.copy2(src_path, dst_path)
-                count += 1
+    # Same bytes as the source rows: indexed without reading the files again
+    changed_set = set(changed)
+    manifest.record_each(final_folder, [(os.path.join(final_folder, rel_path), item)
+                                        for _, rel_path, item in jobs if rel_path in changed_set])
+    manifest.refresh(final_folder)
 
     print("-" * 30)
     print(f"✅ DONE! Your integrated database is ready in: /{final_folder}")
-    print(f"✨ Total fixed files integrated: {count}")
+    print(f"✨ Total fixed files integrated: {from_retry}")
+    print(f"⚡ {len(jobs)} files published, {len(changed)} new/changed ({time.time() - start:.1f}s)")
 
 if __name__ == "__main__":
-    create_final_database()
\ No newline at end of file
+    create_final_database()
@@ -32,105 +32,144 @@ class Helper:
             return "metadata"
         return re.sub(r"(https?://|www\.)", "", url).split("/")[0].split(".")[0]
 
-    def log_error_to_files(
-        self,
-        type_path,
-        error_msg,
-        item_type,
-        rank_abs,
-        rank_gp,
-        suburb,
-        service,
-        url,
-    ):
-        """ثبت خطاها در فایل‌های مربوطه"""
-        try:
-            rank_int = int(rank_abs) if str(rank_abs).isdigit() else 0
-        except:
-            rank_int = 0
-
-        issue_label = "CRITICAL" if rank_int <= 5 else "Error"
-        log_name = "warning.txt" if rank_int <= 5 else "error.txt"
-
-        item_path = os.path.join(
-            "parsed_content_markdowns", self._slugify(suburb), self._slugify(item_type)
+    def tag_for_row(self, row):
+        """parsed_content_markdowns-relative path expected for a SERP row (same as base.Helper.tag_for_row)"""
+        item_type = str(row.get("type", "other")).lower().replace(" ", "_")
+        suburb = row.get("suburb") or row.get("Suburb") or "Unknown"
+        file_name = (
+            f"type-{item_type}_rg{row.get('rank_group', '0')}_ra{row.get('rank_absolute', '0')}"
+            f"_{self._extract_domain(row.get('url') or '')}.md"
         )
-        if not os.path.exists(item_path):
-            os.makedirs(item_path)
-
-        with open(os.path.join(item_path, log_name), "a", encoding="utf-8") as f:
-            f.write(
-                f"[{issue_label}] Rank: {rank_abs} (RG: {rank_gp}) | Error: {error_msg} | URL: {url}\n"
-             )
-
+        return os.path.join(self._slugify(suburb), self._slugify(item_type), file_name)
+
+    def log_errors_bulk(self, missing):
+        """ثبت خطاها در فایل‌های مربوطه (هر فایل فقط یک بار باز می‌شود)"""
+        by_log = {}
+        summary_rows = []
+        for item in missing:
+            try:
+                rank_int = int(item["rank"]) if str(item["rank"]).isdigit() else 0
+            except:
+                rank_int = 0
+
+            issue_label = "CRITICAL" if rank_int <= 5 else "Error"
+            log_name = "warning.txt" if rank_int <= 5 else "error.txt"
+            item_path = os.path.join(
+                self.base_output_folder, self._slugify(item["suburb"]), self._slugify(item["type"])
+            )
+            by_log.setdefault(os.path.join(item_path, log_name), []).append(
+                f"[{issue_label}] Rank: {item['rank']} (RG: {item['rank_group']}) | Error: File Not Found | URL: {item['url']}\n"
+            )
+            summary_rows.append({
+                "Issue": issue_label,
+                "suburb": item["suburb"],
+                "service": item["service"],
+                "type": item["type"],
+                "rank": item["rank"],
+                "rank_group": item["rank_group"],
+                "url": item["url"],
+                "error_type": log_name.replace(".txt", ""),
+                "status": "File Not Found",
+            })
+
+        for log_path, lines in by_log.items():
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            with open(log_path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+
+        is_new = not os.path.exists(self.summary_path)
         with open(self.summary_path, "a", newline="", encoding="utf-8") as f:
             writer = csv.DictWriter(f, fieldnames=self.summary_fields)
-            writer.writerow(
-                {
-                    "Issue": issue_label,
-                    "suburb": suburb,
-                    "service": service,
-                    "type": item_type,
-                    "rank": rank_abs,
-                    "rank_group": rank_gp,
-                    "url": url,
-                    "error_type": log_name.replace(".txt", ""),
-                    "status": error_msg,
-                }
-            )
-
+            if is_new:
+                writer.writeheader()
+            writer.writerows(summary_rows)
 
 
 # ---- Missing File Checker ----
+REPORT_FIELDS = ["Issue", "suburb", "service", "type", "rank", "rank_group", "url", "file_path"]
+
+
 class MissingFileChecker(Helper):
     def __init__(self):
         super().__init__()
         self.input_folder = "serp_outputs"
+        self.report_path = os.path.join(self.base_output_folder, "_missing_report.csv")
 
-    def check_files(self):
+    def expected_files(self):
+        """{relative path: report row} for every row of every SERP CSV"""
+        expected = {}
         csv_files = sorted(
             [f for f in os.listdir(self.input_folder) if f.endswith(".csv")]
         )
-
         print(f"🔍 Found {len(csv_files)} SERP CSV files.\n")
 
         for csv_filename in csv_files:
             full_path = os.path.join(self.input_folder, csv_filename)
-            print(f"📄 Checking: {full_path}")
-
+            print(f"📄 Reading: {full_path}")
             with open(full_path, mode="r", encoding="utf-8") as file:
-                reader = list(csv.DictReader(file))
-                for row in reader:
-                    item_type = str(row.get("type", "other")).lower().replace(" ", "_")
-                    url = row.get("url") or ""
-                    suburb = row.get("suburb") or row.get("Suburb") or "Unknown"
-                    service = row.get("service") or row.get("Service") or "service"
-                    rank_abs = row.get("rank_absolute", "0")
-                    rank_gp = row.get("rank_group", "0")
-
-                    domain_match = self._extract_domain(url)
-                    file_name = (
-                        f"type-{item_type}_rg{rank_gp}_ra{rank_abs}_{domain_match}.md"
-                    )
-                    full_file_path = os.path.join(
-                        "parsed_content_markdowns",
-                        self._slugify(suburb),
-                        self._slugify(item_type),
-                        file_name,
-                    )
-                    if not os.path.exists(full_file_path):
-                        print(f"❌ File Not Found: {full_file_path}")
-
-                        self.log_error_to_files(
-                            type_path=os.path.join(item_type),
-                            error_msg="File Not Found",
-                            item_type=item_type,
-                            rank_abs=rank_abs,
-                            rank_gp=rank_gp,
-                            suburb=suburb,
-                            service=service,
-                            url=url,
-                        )
+                for row in csv.DictReader(file):
+                    rel_path = self.tag_for_row(row)
+                    expected[rel_path] = {
+                        "suburb": row.get("suburb") or row.get("Suburb") or "Unknown",
+                        "service": row.get("service") or row.get("Service") or "service",
+                        "type": str(row.get("type", "other")).lower().replace(" ", "_"),
+                        "rank": row.get("rank_absolute", "0"),
+                        "rank_group": row.get("rank_group", "0"),
+                        "url": row.get("url") or "",
+                        "file_path": os.path.join(self.base_output_folder, rel_path),
+                    }
+        return expected
+
+    def existing_files(self):
+        """Relative paths of every .md file on disk: one os.scandir walk, names only (nothing is opened).
+
+        "_" files and folders (reports, views) are skipped, as in the manifest.
+        """
+        existing = set()
+        stack = [self.base_output_folder]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.startswith("_"):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(".md"):
+                    existing.add(os.path.relpath(entry.path, self.base_output_folder))
+        return existing
+
+    def check_files(self):
+        """Set difference of expected vs existing paths in both directions, written as one report"""
+        expected = self.expected_files()
+        existing = self.existing_files()
+
+        missing = [dict(expected[p], Issue="MISSING") for p in sorted(expected.keys() - existing)]
+        orphans = [
+            {"Issue": "ORPHAN", "file_path": os.path.join(self.base_output_folder, p)}
+            for p in sorted(existing - expected.keys())
+        ]
+
+        for item in missing[:20]:
+            print(f"❌ File Not Found: {item['file_path']}")
+        for item in orphans[:20]:
+            print(f"👻 Orphan (no SERP row): {item['file_path']}")
+
+        if missing:
+            self.log_errors_bulk(missing)
+        with open(self.report_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            writer.writerows(missing + orphans)
+
+        print("\n" + "=" * 30)
+        print(f"📊 Expected: {len(expected)} | On disk: {len(existing)}")
+        print(f"❌ Missing: {len(missing)} | 👻 Orphans: {len(orphans)}")
+        print(f"📝 Report saved to: {self.report_path}")
+        print("=" * 30)
+        return missing, orphans
 
 
 if __name__ == "__main__":
@@ -1,34 +1,123 @@
 import os
 import csv
-import json
-import requests
-import base64
-from config import USERNAME, PASSWORD
+import sys
 from base import Helper, CsvColumn
 import time
 import asyncio
-import aiohttp
-import aiofiles
-from concurrent.futures import ThreadPoolExecutor
+import uuid
+import fastjson
+import http_client
+import passthrough
+import quality
+import storage
+from result_cache import ResultCache, with_tag, compress
+from fanout import FanoutMap, FANOUT_LOG, fan_out
+from ledger import Ledger, IN_FLIGHT, POSTED, FETCHED, FAILED
+from manifest import Manifest, result_meta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import List, Dict, Tuple
 
+CHUNK_SIZE = 100  # task IDs per content_parsing POST (API maximum)
+
+# "inline": parse responses on the event loop thread (fastjson backend) and save on threads
+# "process": stream raw responses to queued_tasks/_spool/ and decode / validate / save them in a process pool
+DECODE_MODE = "inline"
+DECODE_PROCESSES = os.cpu_count() or 4
+
+
+def check_result(task_result):
+    """(is_valid, error_details) for a content_parsing task result (dict or passthrough.RawTask)"""
+    status_msg = task_result.get("status_message")
+    if isinstance(task_result, passthrough.RawTask):
+        has_result = task_result.has_result
+        crawl_progress, pages_crawled = task_result.crawl_progress, task_result.pages_crawled or 0
+    else:
+        result_list = task_result.get("result")
+        has_result = bool(result_list)
+        if has_result:
+            crawl_progress = result_list[0].get("crawl_progress")
+            pages_crawled = result_list[0].get("crawl_status", {}).get("pages_crawled", 0)
+
+    if task_result.get("status_code") != 20000:
+        return False, f"API Error: {status_msg}"
+    if not has_result:
+        return False, "Empty Result"
+
+    # Check crawl status inside result
+    if crawl_progress != "finished":
+        return False, f"Pending/Progress: {crawl_progress}"
+    if pages_crawled == 0:
+        return False, "Crawl Failed (0 pages)"
+    return True, "Unknown Error"
+
+
+def decode_and_save(job):
+    """Process-pool worker: parse one spooled content_parsing response and save every task in it.
+
+    Returns a small summary per task (tag, validity, manifest meta, optional
+    cache body), so the big dicts never travel back to the event loop process.
+    """
+    spool_path, root, fmt, views, want_cache, raw = job
+    with open(spool_path, "rb") as f:
+        body = f.read()
+    os.remove(spool_path)
+    # raw (storage.PASSTHROUGH): split into per-task byte spans and save them as sent
+    tasks = passthrough.split_response(body) if raw else fastjson.loads(body).get("tasks") or []
+
+    store = storage.ResultStore(root, fmt=fmt, views=views)
+    summaries = []
+    for task_result in tasks:
+        task_data = task_result.get("data") or {}
+        summary = {"id": task_result.get("id"), "data": task_data, "tag": task_data.get("tag"), "cache_body": None}
+        summaries.append(summary)
+        if not summary["tag"]:
+            continue
+
+        summary["is_valid"], summary["error"] = check_result(task_result)
+        try:
+            summary["meta"] = result_meta(task_result, store.save(os.path.join(root, summary["tag"]), task_result))
+        except Exception as e:
+            summary["save_error"] = str(e)
+            continue
+        if want_cache and summary["is_valid"] and summary["meta"]["quality"] == quality.OK:
+            summary["cache_body"] = compress(task_result)
+    return summaries
+
+
 
 class ResultFetcher(Helper):
-    def __init__(self, max_concurrent_requests=10, max_workers=4):
+    def __init__(self, max_concurrent_requests=10, max_workers=4, cache=None, ledger=None, manifest=None,
+                 max_buffered_responses=None, decode_mode=None):
         # Queued tasks is input, Parsed markdowns is output
         super().__init__(base_output_folder="parsed_content_markdowns", input_folder="queued_tasks")
+        self.cache = cache  # result_cache.ResultCache, filled with every valid result
+        self.ledger = ledger  # ledger.Ledger: work comes from it and every outcome is recorded
+        self.manifest = manifest  # manifest.Manifest, updated with every file written
+        self.store = storage.ResultStore(self.base_output_folder)  # storage.FORMAT (+ shards)
+        self.posted_data = {}  # task_id -> posted task payload (cache key)
+        self.fanout = None  # primary tag -> duplicate tags, loaded per run
         
         # Configuration for concurrency
         self.max_concurrent_requests = max_concurrent_requests  # Max simultaneous API calls
         self.max_workers = max_workers  # Thread pool size for file I/O
+        self.max_buffered_responses = max_buffered_responses or max_concurrent_requests  # = fetch workers
         self.semaphore = None  # Will be initialized in async context
+        self.decode_mode = decode_mode or DECODE_MODE
+        self.decode_pool = None  # ProcessPoolExecutor in "process" mode, opened per run
+        self.spool_folder = os.path.join(self.input_folder, "_spool")
+        self.client = None  # Shared pooled session, opened in async context
 
     def process_queued_tasks(self):
         """Main entry point - runs async processing"""
         asyncio.run(self._async_process_queued_tasks())
 
     async def _async_process_queued_tasks(self):
-        """Async version of process_queued_tasks"""
+        """Fixed pool of workers pulling full 100-ID chunks from a bounded queue.
+
+        Chunks are packed across task files (or ledger rows) as they are read,
+        so memory stays flat however many files queued_tasks/ holds: at most
+        `max_buffered_responses` responses and twice as many chunks exist at once.
+        """
         # Initialize semaphore in async context
         self.semaphore = asyncio.Semaphore(self.max_concurrent_requests)
         
@@ -37,99 +126,205 @@ class ResultFetcher(Helper):
             print(f"❌ Input folder {self.input_folder} not found")
             return
 
-        task_files = [f for f in os.listdir(self.input_folder) if f.endswith(".json")]
+        self.fanout = FanoutMap(os.path.join(self.input_folder, FANOUT_LOG))
+        if self.ledger is not None:
+            self.ledger.ingest_task_files(self.input_folder)
 
-        if not task_files:
-            print(f"No JSON files found in {self.input_folder}")
-            return
+        # File I/O (saves, manifest, ledger) runs on max_workers threads
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.max_workers))
 
-        # Process all files concurrently
-        tasks = []
-        for file_name in task_files:
-            tasks.append(self._process_single_file(file_name))
-        
-        # Wait for all files to be processed
-        await asyncio.gather(*tasks)
+        chunks = asyncio.Queue(maxsize=self.max_buffered_responses * 2)
+        self.fetched_chunks = 0
 
-    async def _process_single_file(self, file_name: str):
-        """Process a single task file asynchronously"""
-        file_path = os.path.join(self.input_folder, file_name)
-        print(f"📂 Processing task file: {file_name}")
+        if self.decode_mode == "process":
+            if self.store.shards is not None:
+                print("⚠️ Shards need a single writer: decoding inline instead of in a process pool")
+            else:
+                os.makedirs(self.spool_folder, exist_ok=True)
+                self.decode_pool = ProcessPoolExecutor(max_workers=DECODE_PROCESSES)
+                print(f"🧮 Decoding responses in {DECODE_PROCESSES} processes (JSON backend: {fastjson.BACKEND})")
 
+        # One pooled session for the whole run (keep-alive across batches)
         try:
-            # Read file asynchronously
-            async with aiofiles.open(file_path, "r", encoding="utf-8") as f:
-                content = await f.read()
-                data = json.loads(content)
-        except Exception as e:
-            print(f"❌ Error reading {file_name}: {e}")
-            return
+            async with http_client.AsyncClient(limit_per_host=self.max_concurrent_requests) as client:
+                self.client = client
+                workers = [
+                    asyncio.create_task(self._fetch_worker(chunks))
+                    for _ in range(self.max_buffered_responses)
+                ]
+                try:
+                    await self._produce_chunks(chunks)
+                finally:
+                    for _ in workers:
+                        await chunks.put(None)
+                    await asyncio.gather(*workers)
+        finally:
+            if self.decode_pool is not None:
+                self.decode_pool.shutdown()
+                self.decode_pool = None
 
-        # DataForSEO returns tasks in a 'tasks' list within the response
-        tasks = data.get("tasks", [])
-        payload = []
+        if not self.fetched_chunks:
+            print("No posted tasks waiting" if self.ledger is not None else f"No task IDs found in {self.input_folder}")
+        print(f"📈 API stats:\n{http_client.stats.summary()}")
 
-        for task in tasks:
-            task_id = task.get("id")
-            task_url = task.get("data", {}).get("start_url")
+    async def _produce_chunks(self, chunks):
+        """Feed chunks to the workers; reading files / ledger pages happens off the event loop"""
+        loop = asyncio.get_running_loop()
+        it = self._iter_chunks()
+        while True:
+            chunk = await loop.run_in_executor(None, next, it, None)
+            if chunk is None:
+                return
+            await chunks.put(chunk)
 
-            if task_id and task_url:
-                payload.append({"id": task_id, "url": task_url})
+    async def _fetch_worker(self, chunks):
+        while True:
+            item = await chunks.get()
+            if item is None:
+                return
+            source, payload = item
+            self.fetched_chunks += 1
+            await self.fetch_and_save_results(payload, source)
 
+    def _iter_chunks(self, chunk_size=CHUNK_SIZE):
+        """(source, payload) with full chunks of {"id", "url"} repacked across files / ledger pages"""
+        payload = []
+        sources = []
+        for source, entry in (self._iter_ledger_entries() if self.ledger is not None else self._iter_file_entries()):
+            payload.append(entry)
+            if not sources or sources[-1] != source:
+                sources.append(source)
+            if len(payload) >= chunk_size:
+                yield ", ".join(sources), payload
+                payload, sources = [], []
         if payload:
-            await self.fetch_and_save_results(payload, file_name)
-        else:
-            print(f"⚠️ No valid IDs found in {file_name}")
+            yield ", ".join(sources), payload
+
+    def _iter_ledger_entries(self):
+        """Every posted/ready task in the ledger, paged (one indexed query per page)"""
+        seen = set()
+        for row in self.ledger.iter_rows(IN_FLIGHT):
+            task_id = row["task_id"]
+            if not task_id or task_id in seen:
+                continue  # duplicates share their primary's task
+            seen.add(task_id)
+            self.posted_data[task_id] = self.build_onpage_task(row) or {}
+            yield "ledger", {"id": task_id, "url": row["url"]}
+
+    def _iter_file_entries(self):
+        """Task IDs from queued_tasks/*.json, streamed (one task of one file in memory at a time)"""
+        task_files = sorted(f for f in os.listdir(self.input_folder) if f.endswith(".json") and not f.startswith("_"))
+        for file_name in task_files:
+            print(f"📂 Processing task file: {file_name}")
+
+            # DataForSEO returns tasks in a 'tasks' list within the response
+            found = 0
+            try:
+                for task in passthrough.iter_file_tasks(os.path.join(self.input_folder, file_name)):
+                    task_data = task.data
+                    task_id = task.id
+                    task_url = task_data.get("start_url")
+
+                    if task_id and task_url:
+                        found += 1
+                        if self.cache is not None:
+                            self.posted_data[task_id] = task_data
+                        yield file_name, {"id": task_id, "url": task_url}
+            except (OSError, ValueError) as e:
+                print(f"❌ Error reading {file_name}: {e}")
+                continue
+            if not found:
+                print(f"⚠️ No valid IDs found in {file_name}")
 
     async def fetch_and_save_results(self, payload: List[Dict], original_filename: str):
         """Async version of fetch_and_save_results"""
-        endpoint = "https://api.dataforseo.com/v3/on_page/content_parsing"
-
+        if self.decode_pool is not None:
+            return await self._fetch_via_pool(payload, original_filename)
         try:
             print(f"📡 Requesting content for {len(payload)} URLs...")
             
             # Use semaphore to limit concurrent requests
             async with self.semaphore:
-                async with aiohttp.ClientSession() as session:
-                    # Prepare auth
-                    auth = aiohttp.BasicAuth(USERNAME, PASSWORD)
-                    
-                    async with session.post(
-                        endpoint,
-                        json=payload,
-                        auth=auth,
-                        timeout=aiohttp.ClientTimeout(total=120),
-                        headers={"Content-Type": "application/json"}
-                    ) as response:
-                        if response.status == 200:
-                            res = await response.json()
-                            
-                            # Process results concurrently using thread pool for I/O
-                            save_tasks = []
-                            for i in res["tasks"]:
-                                save_tasks.append(self._process_and_save_result(i))
-                            
-                            # Wait for all saves to complete
-                            await asyncio.gather(*save_tasks)
-                        else:
-                            text = await response.text()
-                            print(f"❌ API Error: {response.status} - {text}")
+                status, res = await self.client.post_json(
+                    "on_page/content_parsing", payload, raw=storage.PASSTHROUGH
+                )
+
+            if status == 200:
+                if storage.PASSTHROUGH:
+                    # Per-task byte spans, saved as the API sent them (no parse / re-encode)
+                    tasks = await asyncio.get_running_loop().run_in_executor(None, passthrough.split_response, res)
+                else:
+                    tasks = res["tasks"]
+
+                # Process results concurrently using thread pool for I/O
+                save_tasks = []
+                for i in tasks:
+                    save_tasks.append(self._process_and_save_result(i))
+
+                # Wait for all saves to complete
+                await asyncio.gather(*save_tasks)
+            else:
+                print(f"❌ API Error: {status} - {res}")
+
+        except asyncio.TimeoutError:
+            print(f"❌ Timeout Error for {original_filename}")
+        except Exception as e:
+            print(f"❌ Connection Error: {str(e)}")
+
+    async def _fetch_via_pool(self, payload: List[Dict], original_filename: str):
+        """DECODE_MODE "process": stream the response to a spool file, decode + save it in the process pool"""
+        loop = asyncio.get_running_loop()
+        spool_path = os.path.join(self.spool_folder, f"{uuid.uuid4().hex}.json")
+        try:
+            print(f"📡 Requesting content for {len(payload)} URLs...")
+            async with self.semaphore:
+                status, _ = await self.client.post_to_file("on_page/content_parsing", payload, spool_path)
+
+            if status != 200:
+                with open(spool_path, "rb") as f:
+                    print(f"❌ API Error: {status} - {f.read(500)!r}")
+                os.remove(spool_path)
+                return
 
+            job = (
+                spool_path, self.base_output_folder, self.store.fmt, self.store.views, self.cache is not None,
+                storage.PASSTHROUGH,
+            )
+            summaries = await loop.run_in_executor(self.decode_pool, decode_and_save, job)
         except asyncio.TimeoutError:
             print(f"❌ Timeout Error for {original_filename}")
+            return
         except Exception as e:
             print(f"❌ Connection Error: {str(e)}")
+            return
+
+        for summary in summaries:
+            if not summary["tag"]:
+                print("⚠️ No tag found in result")
+                continue
+            file_path = os.path.join(self.base_output_folder, summary["tag"])
+            if summary.get("save_error"):
+                print(f"❌ Failed to save {file_path}: {summary['save_error']}")
+                continue
+
+            posted = self.posted_data.pop(summary["id"], None)
+            if summary["cache_body"] is not None and self.cache is not None and posted:
+                await loop.run_in_executor(None, self.cache.put_compressed, posted, summary["cache_body"])
+            await self._finish_result(
+                summary["data"], file_path, summary["is_valid"], summary["error"], summary["meta"]
+            )
 
     async def _process_and_save_result(self, task_result: Dict):
-        """Process and save a single result asynchronously"""
-        file_path = task_result.get("data", {}).get("tag", None)
+        """Process and save a single result asynchronously. Returns (file_path, is_valid)."""
+        tag = task_result.get("data", {}).get("tag", None)
 
-        if not file_path:
+        if not tag:
             print("⚠️ No tag found in result")
-            return
+            return None, False
 
         # Create a sub-directory named after the original file
-        file_path = os.path.join(self.base_output_folder, file_path)
+        file_path = os.path.join(self.base_output_folder, tag)
         dir_name = os.path.dirname(file_path)
 
         # Create directory if needed (use thread pool for I/O)
@@ -137,41 +332,67 @@ class ResultFetcher(Helper):
         await loop.run_in_executor(None, self._ensure_directory, dir_name)
 
         # Validate Result
-        status_msg = task_result.get("status_message")
-        result_list = task_result.get("result")
-        
-        is_valid = True
-        error_details = "Unknown Error"
-
-        if task_result.get("status_code") != 20000:
-            is_valid = False
-            error_details = f"API Error: {status_msg}"
-        elif not result_list:
-            is_valid = False
-            error_details = "Empty Result"
-        else:
-            # Check crawl status inside result
-            crawl_progress = result_list[0].get("crawl_progress")
-            crawl_status = result_list[0].get("crawl_status", {})
-            
-            if crawl_progress != "finished":
-                is_valid = False
-                error_details = f"Pending/Progress: {crawl_progress}"
-            elif crawl_status.get("pages_crawled", 0) == 0:
-                is_valid = False
-                error_details = "Crawl Failed (0 pages)"
+        is_valid, error_details = check_result(task_result)
 
-        if not is_valid:
-            # Log to CSV (run in thread pool to avoid blocking)
-            print(f"⚠️ Invalid Result for {file_path}: {error_details}")
-            await loop.run_in_executor(None, self._log_error, task_result, file_path, error_details)
+        posted = self.posted_data.pop(task_result.get("id"), None)
+        if is_valid and self.cache is not None and posted:
+            await loop.run_in_executor(None, self.cache.put, posted, task_result)
 
-        # Save the result asynchronously
+        # Encode, save and score the result off the event loop (format per storage.FORMAT)
+        extra_paths = [os.path.join(self.base_output_folder, t) for t in self._extra_tags(tag)]
         try:
-            async with aiofiles.open(file_path, "w", encoding="utf-8") as f:
-                await f.write(json.dumps(task_result, indent=4))
+            meta = await loop.run_in_executor(None, self._save, file_path, task_result, extra_paths)
         except Exception as e:
             print(f"❌ Failed to save {file_path}: {e}")
+            return file_path, False
+
+        return await self._finish_result(task_result.get("data") or {}, file_path, is_valid, error_details, meta)
+
+    def _extra_tags(self, tag):
+        """Tags that collapsed into this task (same URL elsewhere in the SERP)"""
+        return self.fanout.extras(tag) if self.fanout else []
+
+    def _save(self, file_path, task_result, extra_paths):
+        return result_meta(task_result, self.store.save(file_path, task_result, extra_paths))
+
+    async def _finish_result(self, task_data, file_path, is_valid, error_details, meta):
+        """Everything after the file is written: error log, fan-out, manifest, ledger"""
+        loop = asyncio.get_event_loop()
+        extra_tags = self._extra_tags(task_data.get("tag"))
+        tags = [task_data.get("tag")] + extra_tags
+
+        if not is_valid:
+            # Log to CSV (run in thread pool to avoid blocking)
+            print(f"⚠️ Invalid Result for {file_path}: {error_details}")
+            await loop.run_in_executor(None, self._log_error, {"data": task_data}, file_path, error_details)
+            for extra_tag in extra_tags:
+                await loop.run_in_executor(
+                    None, self._log_error, with_tag({"data": task_data}, extra_tag),
+                    os.path.join(self.base_output_folder, extra_tag), error_details,
+                )
+
+        extra_paths = [os.path.join(self.base_output_folder, t) for t in extra_tags]
+        if extra_paths:
+            await loop.run_in_executor(None, fan_out, file_path, extra_paths)
+
+        if self.manifest is not None:
+            await loop.run_in_executor(
+                None, self.manifest.record, self.base_output_folder, [file_path] + extra_paths, meta,
+            )
+
+        if self.ledger is not None:
+            await loop.run_in_executor(None, self._record, tags, file_path, is_valid, error_details)
+
+        return file_path, is_valid
+
+    def _record(self, tags, file_path, is_valid, error_details):
+        """Ledger outcome: fetched, still in flight (crawl pending) or failed"""
+        if is_valid:
+            self.ledger.set_state(tags, FETCHED, size=os.path.getsize(file_path))
+        elif error_details.startswith("Pending"):
+            self.ledger.set_state(tags, POSTED, error=error_details)
+        else:
+            self.ledger.set_state(tags, FAILED, error=error_details)
 
     def _ensure_directory(self, dir_name: str):
         """Ensure directory exists (thread-safe)"""
@@ -227,13 +448,20 @@ if __name__ == "__main__":
     # You can adjust these parameters for optimal performance
     # max_concurrent_requests: How many API calls to make simultaneously (default: 10)
     # max_workers: Thread pool size for file I/O operations (default: 4)
-    fetcher = ResultFetcher(max_concurrent_requests=10, max_workers=5)
+    # --process-decode: decode / validate / save responses in a process pool (see DECODE_MODE)
+    # --passthrough: save each task as the bytes the API sent (see storage.PASSTHROUGH)
+    decode_mode = "process" if "--process-decode" in sys.argv else None
+    if "--passthrough" in sys.argv:
+        storage.PASSTHROUGH = True
+    fetcher = ResultFetcher(max_concurrent_requests=10, max_workers=5, cache=ResultCache(), ledger=Ledger(),
+                            manifest=Manifest(), decode_mode=decode_mode)
     
     start_time = time.time()
     fetcher.process_queued_tasks()
     elapsed = time.time() - start_time
     
     print(f"\n✅ All tasks completed in {elapsed:.2f} seconds")
+    print(f"📒 Ledger: {fetcher.ledger.counts()}")
 
 # {'version': '0.1.20251226', 'status_code': 20000, 'status_message': 'Ok.', 'time': '0.1586 sec.', 'cost': 0, 'tasks_count': 8, 'tasks_error': 0,
 # 'tasks': [{'id': '01140958-1303-0216-0000-b86bcc46294a',
@@ -1,176 +1,172 @@
-import csv
-import json
+import asyncio
+import hashlib
 import os
 import sys
+import threading
+import time
 from base import Helper, CsvColumn
+import http_client
+import post_page
+from result_cache import ResultCache
+from fanout import Deduper, FANOUT_LOG
+from ledger import Ledger, SERP_SEEN, FETCHED
+from manifest import Manifest
 
-PROGRESS_FILE = "parsing_progress.json"
+BATCH_SIZE = 100  # DataForSEO accepts up to 100 tasks per task_post
+POSTERS = 4  # concurrent task_post requests
 
 class OnPageFetcher(Helper):
-    def __init__(self, force_restart=False):
+    def __init__(self, force_restart=False, batch_size=BATCH_SIZE, posters=POSTERS, use_cache=True):
         super().__init__(base_output_folder="queued_tasks", input_folder="serp_outputs")
-        self.all_url_post_list = []
         self.force_restart = force_restart
-        
-        # Delete progress file if force restart
-        if self.force_restart and os.path.exists(PROGRESS_FILE):
-            os.remove(PROGRESS_FILE)
-            print("🔄 Force restart: Progress file deleted\n")
-        
+        self.batch_size = min(batch_size, 100)
+        self.posters = posters
+        self.cache = ResultCache() if use_cache else None
+        self.manifest = Manifest() if use_cache else None
+        self.cache_hits = 0
+        self.deduper = Deduper(os.path.join(self.base_output_folder, FANOUT_LOG))
+        self.ledger = Ledger()
+        self.task_ids = {}  # posted primary tag -> task_id
+        self._fold_lock = threading.Lock()  # folding (iter_tasks thread) vs recording a post (_poster)
+
+        # Forget posting progress if force restart
+        if self.force_restart:
+            self.ledger.reset()
+            print("🔄 Force restart: Ledger progress reset\n")
+
         # Validate input folder exists
         if not os.path.exists(self.input_folder):
             print(f"❌ Error: Input folder '{self.input_folder}' not found!")
             return
-            
-        # Process CSV files
-        self.csv_files = sorted(
-            [f for f in os.listdir(self.input_folder) if f.endswith(".csv")]
-        )
+
         print(
             "🚀 Starting Scraping... (JS, Browser Rendering, and Switch Pool: ENABLED)"
         )
-        print(f"📊 Found {len(self.csv_files)} CSV files to process\n")
+        new_files = self.ledger.ingest_serp_folder(self, self.input_folder, on_meta=self._save_meta)
+        self.ledger.ingest_task_files(self.base_output_folder)
+        print(f"📊 Ingested {new_files} new CSV files; ledger: {self.ledger.counts()}\n")
+
+    def _save_meta(self, row, row_data):
+        print(f"   📄 Saving Meta for Rank {row_data[CsvColumn.RANK_ABSOLUTE.value]}")
+        self.save_metadata_row(row, row_data)
+
+    def iter_tasks(self):
+        """Stream every crawlable work item the ledger still has in serp_seen (paged, see Ledger.iter_rows)"""
+        for row_data in self.ledger.iter_rows(SERP_SEEN):
+            task = self.build_onpage_task(row_data)
+            if not task:
+                continue
 
-    def load_progress(self):
-        if os.path.exists(PROGRESS_FILE):
-            with open(PROGRESS_FILE, "r") as f:
-                return json.load(f)
-        return {"last_file": None, "last_row_index": -1}
+            rank_abs = row_data[CsvColumn.RANK_ABSOLUTE.value]
+            domain_match = self._extract_domain(task["start_url"])
+            if self.cache:
+                file_path = self.cache.materialize(task, "parsed_content_markdowns", self.manifest)
+                if file_path:
+                    print(f"   💾 Cache hit for {domain_match} (Rank {rank_abs})")
+                    self.cache_hits += 1
+                    self.ledger.set_state(task["tag"], FETCHED, size=os.path.getsize(file_path))
+                    continue
+            with self._fold_lock:
+                is_new = self.deduper.add(task)
+                task_id = None if is_new else self.task_ids.get(self.deduper.primary(task))
+            if not is_new:
+                print(f"   🔗 Duplicate of an earlier task: {domain_match} (Rank {rank_abs})")
+                if task_id:
+                    # Primary already posted: share its task now, so the row leaves serp_seen
+                    self.ledger.mark_posted([(task["tag"], task_id)])
+                continue
+            print(f"   🔍 Parsing {domain_match} (Rank {rank_abs})...")
+            yield task
+
+    def iter_batches(self):
+        """Group streamed tasks into batches of up to batch_size with a stable batch ID"""
+        batch = []
+        for task in self.iter_tasks():
+            batch.append(task)
+            if len(batch) >= self.batch_size:
+                yield self._batch_id(batch), batch
+                batch = []
+        if batch:
+            yield self._batch_id(batch), batch
+
+    def _batch_id(self, batch):
+        suburb = batch[0]["tag"].split(os.sep)[0]
+        digest = hashlib.sha1("\n".join(t["tag"] for t in batch).encode("utf-8")).hexdigest()[:12]
+        return f"{suburb}_{digest}"
+
+    async def _poster(self, client, batches):
+        while True:
+            item = await batches.get()
+            if item is None:
+                return
 
-    def save_progress(self, filename, row_index):
-        with open(PROGRESS_FILE, "w") as f:
-            json.dump({"last_file": filename, "last_row_index": row_index}, f)
+            batch_id, batch = item
+            print(f"\n   📡 Posting batch {batch_id} ({len(batch)} tasks)...")
+            status, body = await post_page.post_onpage_task_async(
+                client, batch, output_dir=self.base_output_folder, filename=f"{batch_id}.json"
+            )
+
+            if status == 200:
+                print(f"      ✅ Posted batch of {len(batch)} tasks.")
+                posted = []
+                with self._fold_lock:
+                    for task in body.get("tasks") or []:
+                        tag = (task.get("data") or {}).get("tag")
+                        if task.get("status_code") == 20100 and tag:
+                            # Duplicates folded so far share the primary's task; later ones are marked as they fold
+                            self.task_ids[tag] = task["id"]
+                            posted += [(t, task["id"]) for t in [tag] + self.deduper.extras(tag)]
+                self.ledger.mark_posted(posted)
+                self.ledger.mark_ingested(f"{batch_id}.json", "tasks")
+            else:
+                print(f"      ⚠️ Batch post failed.")
+
+    async def _async_fetch_content_parsing(self):
+        batches = asyncio.Queue(maxsize=self.posters * 2)
+
+        async with http_client.AsyncClient(limit_per_host=self.posters) as client:
+            posters = [
+                asyncio.create_task(self._poster(client, batches))
+                for _ in range(self.posters)
+            ]
+            try:
+                # Ledger pages, cache lookups and cache-hit writes happen off the event loop
+                loop = asyncio.get_running_loop()
+                it = self.iter_batches()
+                while True:
+                    item = await loop.run_in_executor(None, next, it, None)
+                    if item is None:
+                        break
+                    await batches.put(item)
+            finally:
+                for _ in posters:
+                    await batches.put(None)
+                await asyncio.gather(*posters)
 
     def fetch_content_parsing_from_folder(self):
-        """Fetch and parse content from CSV files in input folder"""
-        # Load previous progress
-        progress = self.load_progress()
-        last_file = progress["last_file"]
-        last_row_idx = progress["last_row_index"]
+        """Ingest new SERP CSVs, then batch every unposted work item and post with concurrent posters"""
         self._initialize_summary_csv()
+        start_time = time.time()
 
-        for csv_idx, csv_filename in enumerate(self.csv_files, 1):
-            # Skip already processed files
-            if last_file and csv_filename < last_file:
-                print(f"⏭️  Skipping {csv_filename} (already processed)")
-                continue
-
-            print(f"\n📁 Processing file {csv_idx}/{len(self.csv_files)}: {csv_filename}")
-            csv_path = os.path.join(self.input_folder, csv_filename)
-
-            try:
-                with open(csv_path, mode="r", encoding="utf-8") as file:
-                    reader = list(csv.DictReader(file))
-                    print(f"   Found {len(reader)} rows")
-
-                    for idx, row in enumerate(reader):
-                        # Skip already processed rows
-                        if csv_filename == last_file and idx <= last_row_idx:
-                            continue
-
-                        # Extract row data using base helper
-                        row_data = self.normalize_row(row)
-                        
-                        item_type = row_data[CsvColumn.TYPE.value]
-                        url = row_data[CsvColumn.URL.value]
-                        suburb = row_data[CsvColumn.SUBURB.value]
-                        rank_abs = row_data[CsvColumn.RANK_ABSOLUTE.value]
-                        rank_gp = row_data[CsvColumn.RANK_GROUP.value]
-                        domain = row_data[CsvColumn.DOMAIN.value]
-
-                        domain_match = self._extract_domain(url)
-                        file_name = f"type-{item_type}_rg{rank_gp}_ra{rank_abs}_{domain_match}.md"
-                        file_path = os.path.join(
-                            self._slugify(suburb), self._slugify(item_type), file_name
-                        )
-
-                        # Process URLs or save metadata
-                        if url and url.startswith("http") and "google.com" not in url:
-                            print(f"   🔍 Parsing {domain_match} (Rank {rank_abs})...")
-                            self.all_url_post_list.append(
-                                {
-                                    "target": domain,
-                                    "start_url": url,
-                                    "enable_content_parsing": True,
-                                    "max_crawl_pages": 1,
-                                    "tag": file_path,
-                                }
-                            )
-                        else:
-                            print(f"   📄 Saving Meta for Rank {rank_abs}")
-                            full_file_path = os.path.join(
-                                "parsed_content_markdowns", file_path
-                            )
-                            dir_name = os.path.dirname(full_file_path)
-
-                            if not os.path.exists(dir_name):
-                                os.makedirs(dir_name)
-
-                            with open(full_file_path, "w", encoding="utf-8") as f:
-                                f.write(
-                                    f"# Type: {item_type} | Rank: {rank_abs} | RG: {rank_gp}\n"
-                                )
-                                f.write("### Raw Row Data:\n")
-                                json.dump(row, f, indent=4)
-                        
-                        # Post batch if we've accumulated 50+ tasks
-                        if len(self.all_url_post_list) >= 50:
-                            print(f"\n   📡 Batch limit reached, posting {len(self.all_url_post_list)} tasks...")
-                            self.post_tasks(csv_filename, idx)
-
-            except KeyboardInterrupt:
-                print("\n🛑 Stopped by user. Progress saved.")
-                # Post any remaining tasks before exiting
-                if self.all_url_post_list:
-                    self.post_tasks(csv_filename, idx, end=True)
-                return
-            except Exception as e:
-                print(f"   ❌ Error processing file {csv_filename}: {e}")
-                continue  # Continue to next CSV file
-
-            # Post any remaining tasks for this CSV file
-            if self.all_url_post_list:
-                print(f"\n   📡 Posting remaining {len(self.all_url_post_list)} tasks for {csv_filename}...")
-                self.post_tasks(csv_filename, idx, end=True)
-            
-            print(f"   ✅ Completed {csv_filename}")
-
-        print("\n🎉 All CSV files processed successfully!")
-
-    def post_tasks(self, csv_filename, idx, end: bool = False):
-        if not csv_filename:
-            csv_filename = "unknown"
-
-        if end or len(self.all_url_post_list) > 50:
-            self.post_onpage_task(csv_filename, idx)
-
-    def post_onpage_task(self, csv_filename, idx):
-        from post_page import post_onpage_task as shared_post_task
-        
-        import time
-        safe_name = f"{csv_filename.replace('.csv', '')}_{int(time.time())}.json"
-        
-        resp = shared_post_task(
-            self.headers, 
-            self.all_url_post_list, 
-            output_dir=self.base_output_folder, 
-            filename=safe_name
-        )
-        
-        if resp and resp.status_code == 200:
-            print(f"      ✅ Posted batch of {len(self.all_url_post_list)} tasks.")
-        else:
-            print(f"      ⚠️ Batch post failed.")
+        try:
+            asyncio.run(self._async_fetch_content_parsing())
+        except KeyboardInterrupt:
+            print("\n🛑 Stopped by user. Progress is in the ledger.")
+            return
 
-        self.all_url_post_list = []
-        self.save_progress(csv_filename, idx)
+        print(f"\n🎉 All CSV files processed successfully! ({time.time() - start_time:.1f}s)")
+        if self.cache:
+            print(f"💾 Served {self.cache_hits} results from cache (no API call)")
+        print(f"🔗 Collapsed {self.deduper.collapsed} duplicate URLs into shared tasks")
+        print(f"📒 Ledger: {self.ledger.counts()}")
 
 
 if __name__ == "__main__":
     # Check for --force-restart flag
     force_restart = "--force-restart" in sys.argv or "-f" in sys.argv
-    
+    use_cache = "--no-cache" not in sys.argv
+
     if force_restart:
         print("⚠️  FORCE RESTART MODE: All files will be reprocessed\n")
-    
-    OnPageFetcher(force_restart=force_restart).fetch_content_parsing_from_folder()
+
+    OnPageFetcher(force_restart=force_restart, use_cache=use_cache).fetch_content_parsing_from_folder()
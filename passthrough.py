@@ -0,0 +1,190 @@
+import re
+
+import fastjson
+
+READ_CHUNK = 64 * 1024  # bytes read at a time by the file readers
+
+# One JSON string (escapes included) or one bracket: strings are skipped whole by the regex engine.
+# A lone quote is a string that does not end inside the buffer (more bytes needed).
+_TOKEN_RE = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\]]|"')
+_SEP_RE = re.compile(rb"[\s,]*")
+_TASKS_RE = re.compile(rb'"tasks"\s*:\s*\[')
+
+# Task-level fields precede "result" in a DataForSEO task, so the first match is the task's own
+_ID_RE = re.compile(rb'"id"\s*:\s*"([^"]*)"')
+_STATUS_RE = re.compile(rb'"status_code"\s*:\s*(-?\d+)')
+_MESSAGE_RE = re.compile(rb'"status_message"\s*:\s*("[^"\\]*(?:\\.[^"\\]*)*")')
+_DATA_RE = re.compile(rb'"data"\s*:\s*(?=\{)')
+_RESULT_RE = re.compile(rb'"result"\s*:\s*(null|\[\s*\]|\[)')
+_PROGRESS_RE = re.compile(rb'"crawl_progress"\s*:\s*"([^"]*)"')
+_PAGES_RE = re.compile(rb'"pages_crawled"\s*:\s*(\d+)')
+
+_OPEN = (ord("{"), ord("["))
+_CLOSE = (ord("}"), ord("]"))
+_QUOTE = ord('"')
+
+
+def _advance(buf, pos, depth):
+    """Scan buf from pos with `depth` brackets open. Returns (pos, depth, closed).
+
+    closed: depth got back to 0 and pos is just past the closing bracket.
+    Otherwise pos is where to resume once more bytes are appended.
+    """
+    for match in _TOKEN_RE.finditer(buf, pos):
+        ch = buf[match.start()]
+        if ch == _QUOTE:
+            if match.end() - match.start() == 1:
+                return match.start(), depth, False
+            continue
+        depth += 1 if ch in _OPEN else -1
+        if depth == 0:
+            return match.end(), 0, True
+    return len(buf), depth, False
+
+
+def value_end(buf, start):
+    """Index just past the JSON object / array that starts at buf[start]"""
+    end, _, closed = _advance(buf, start, 0)
+    if not closed:
+        raise ValueError("unterminated JSON value")
+    return end
+
+
+def iter_task_spans(body):
+    """Yield the raw bytes of every element of a response's top-level "tasks" array, unparsed"""
+    match = _TASKS_RE.search(body)
+    if match is None:
+        return
+    pos = match.end()
+    while True:
+        pos = _SEP_RE.match(body, pos).end()
+        if pos >= len(body) or body[pos] != _OPEN[0]:
+            return  # "]" closes the array
+        end = value_end(body, pos)
+        yield body[pos:end]
+        pos = end
+
+
+def iter_file_task_spans(path, chunk_size=READ_CHUNK):
+    """iter_task_spans over a saved response, read in chunks: memory is one task + one chunk, not the file"""
+    with open(path, "rb") as f:
+        buf = b""
+        while True:
+            match = _TASKS_RE.search(buf)
+            if match is not None:
+                break
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            buf = buf[-256:] + chunk  # the header before "tasks" is small; keep a tail for a split key
+
+        buf, pos = buf[match.end():], 0
+        while True:
+            pos = _SEP_RE.match(buf, pos).end()
+            if pos == len(buf):
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                buf, pos = chunk, 0
+                continue
+            if buf[pos] != _OPEN[0]:
+                return  # "]" closes the array
+
+            scan, depth, closed = _advance(buf, pos, 0)
+            while not closed:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    raise ValueError(f"unterminated task in {path}")
+                buf, scan = buf[pos:] + chunk, scan - pos
+                pos = 0
+                scan, depth, closed = _advance(buf, scan, depth)
+            yield buf[pos:scan]
+            pos = scan
+
+
+def split_response(body):
+    """RawTask per task of a raw content_parsing response"""
+    return [RawTask(span) for span in iter_task_spans(body)]
+
+
+def iter_file_tasks(path, chunk_size=READ_CHUNK):
+    """RawTask per task of a saved response file (queued_tasks/*.json, smart-fix batch files), streamed"""
+    for span in iter_file_task_spans(path, chunk_size):
+        yield RawTask(span)
+
+
+def iter_task_refs(path, chunk_size=READ_CHUNK):
+    """(task_id, start_url, tag) per task of a saved task_post response, streamed"""
+    for task in iter_file_tasks(path, chunk_size):
+        data = task.data
+        yield task.id, data.get("start_url"), data.get("tag")
+
+
+class RawTask:
+    """One content_parsing task kept as the exact bytes the API sent.
+
+    The fields the save path needs (id, status, tag, crawl progress) are read
+    with regexes, `data` is parsed on its own (a small flat object), and any
+    other key parses the whole task once. Savers write `raw` unchanged.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self._data = None
+        self._parsed = None
+
+    def _search(self, regex):
+        match = regex.search(self.raw)
+        return match.group(1) if match else None
+
+    @property
+    def id(self):
+        value = self._search(_ID_RE)
+        return value.decode("utf-8") if value is not None else None
+
+    @property
+    def status_code(self):
+        value = self._search(_STATUS_RE)
+        return int(value) if value is not None else None
+
+    @property
+    def status_message(self):
+        value = self._search(_MESSAGE_RE)
+        return fastjson.loads(value) if value is not None else None
+
+    @property
+    def has_result(self):
+        """False when "result" is missing, null or []"""
+        return self._search(_RESULT_RE) == b"["
+
+    @property
+    def crawl_progress(self):
+        value = self._search(_PROGRESS_RE)
+        return value.decode("utf-8") if value is not None else None
+
+    @property
+    def pages_crawled(self):
+        value = self._search(_PAGES_RE)
+        return int(value) if value is not None else None
+
+    @property
+    def data(self):
+        if self._data is None:
+            match = _DATA_RE.search(self.raw)
+            self._data = fastjson.loads(self.raw[match.end():value_end(self.raw, match.end())]) if match else {}
+        return self._data
+
+    def parsed(self):
+        """The whole task as a dict (parsed on first use)"""
+        if self._parsed is None:
+            self._parsed = fastjson.loads(self.raw)
+        return self._parsed
+
+    def get(self, key, default=None):
+        if key == "data":
+            return self.data
+        if key in ("id", "status_code", "status_message"):
+            value = getattr(self, key)
+        else:
+            value = self.parsed().get(key)
+        return default if value is None else value
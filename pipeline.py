@@ -0,0 +1,285 @@
+import argparse
+import asyncio
+import os
+import re
+import time
+
+import http_client
+import main
+import quality
+import result_cache
+import task_watcher
+from base import Helper
+from fanout import Deduper, FANOUT_LOG, fan_out
+from ledger import Ledger, FETCHED, LOW_QUALITY, RESCUED
+from manifest import Manifest, content_meta, result_meta
+from on_page_get import ResultFetcher
+from result_cache import ResultCache
+from smart_fix import SmartFixer
+
+QUEUE_SIZE = 500  # max items buffered between two stages
+FETCH_WORKERS = 4
+RESCUE_MAX_RANK = 10  # same as smart_fix: only top-10 organic results are rescued
+
+
+class Pipeline(Helper):
+    """Single-process run: SERP → post → fetch → rescue as concurrent stages.
+
+    Stages are joined by bounded in-memory queues, so tasks are posted as soon
+    as the first SERP result arrives, fetched as soon as tasks_ready reports
+    them and re-crawled as soon as a weak result is saved. serp_outputs/,
+    queued_tasks/, smart_fix/ and parsed_content_markdowns/ are still written
+    as durable side outputs.
+    """
+
+    def __init__(self, list_csv="list.csv", serp_concurrency=main.MAX_CONCURRENT,
+                 fetch_workers=FETCH_WORKERS, rescue=True, use_cache=True):
+        super().__init__(base_output_folder="parsed_content_markdowns", input_folder="serp_outputs")
+        self.list_csv = list_csv
+        self.serp_concurrency = serp_concurrency
+        self.fetch_workers = fetch_workers
+        self.rescue = rescue
+
+        self.ledger = Ledger()
+        self.manifest = Manifest()
+        self.result_fetcher = ResultFetcher(ledger=self.ledger, manifest=self.manifest)
+        self.fixer = SmartFixer()
+        self.cache = ResultCache() if use_cache else None
+        self.run_id = int(time.time())
+        self.deduper = Deduper(os.path.join(self.result_fetcher.input_folder, FANOUT_LOG))
+        self.counts = {
+            "serp": 0, "tasks": 0, "meta": 0, "cache_hits": 0, "duplicates": 0,
+            "fetched": 0, "rescue_queued": 0, "rescued": 0,
+        }
+
+    # ---------------- STAGE 1: SERP ----------------
+    async def _serp_worker(self, client, jobs, rows, serp_out):
+        while True:
+            job = await jobs.get()
+            if job is None:
+                return
+            service, suburb = job
+            items = await main.fetch_serp_async(client, service, suburb)
+            if items is None:
+                continue
+
+            self.counts["serp"] += 1
+            await serp_out.put((service, suburb, items))  # durable CSV via the single writer
+            for row in main.serp_rows(service, suburb, items):
+                await rows.put(row)
+
+    async def serp_stage(self, client, rows, serp_out):
+        jobs = asyncio.Queue(maxsize=self.serp_concurrency * 2)
+        workers = [
+            asyncio.create_task(self._serp_worker(client, jobs, rows, serp_out))
+            for _ in range(self.serp_concurrency)
+        ]
+        try:
+            for job in main.iter_list_rows(self.list_csv):
+                await jobs.put(job)
+            for _ in workers:
+                await jobs.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            await rows.put(None)
+
+    # ---------------- STAGE 2: ROWS → TASKS ----------------
+    async def task_stage(self, rows, tasks, rescue_queue):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                row = await rows.get()
+                if row is None:
+                    return
+
+                row_data = self.normalize_row(row)
+                row_data["tag"] = self.tag_for_row(row_data)
+                await loop.run_in_executor(None, self.ledger.add_rows, [row_data])
+                task = self.build_onpage_task(row_data)
+                if task and self.cache:
+                    file_path = await loop.run_in_executor(
+                        None, self.cache.materialize, task, self.base_output_folder, self.manifest
+                    )
+                    if file_path:
+                        self.counts["cache_hits"] += 1
+                        await loop.run_in_executor(
+                            None, self.ledger.set_state, task["tag"], FETCHED, os.path.getsize(file_path)
+                        )
+                        await self._maybe_rescue(file_path, True, task["start_url"], rescue_queue)
+                        continue
+
+                if task and not self.deduper.add(task):
+                    self.counts["duplicates"] += 1
+                elif task:
+                    self.counts["tasks"] += 1
+                    await tasks.put(task)
+                else:
+                    self.counts["meta"] += 1
+                    await loop.run_in_executor(None, self.save_metadata_row, row, row_data)
+                    await loop.run_in_executor(None, self.ledger.set_state, row_data["tag"], FETCHED)
+        finally:
+            await tasks.put(None)
+
+    # ---------------- STAGE 3: FETCH + LOW QUALITY DETECTION ----------------
+    def needs_rescue(self, file_path, is_valid, url):
+        """Top-10 organic, non-directory results that failed or were scored low quality when saved"""
+        if not file_path or not url or "organic" not in file_path.lower():
+            return False
+
+        rg_match = re.search(r'_rg(\d+)', os.path.basename(file_path))
+        r_grp = int(rg_match.group(1)) if rg_match else 0
+        if r_grp > RESCUE_MAX_RANK or self.fixer.is_directory(url):
+            return False
+
+        if not is_valid:
+            return True
+        row = self.manifest.get(self.base_output_folder, file_path)
+        if row is None:  # not indexed yet: score the saved file rather than assume it is weak
+            with open(file_path, "rb") as f:
+                row = content_meta(f.read())
+        return quality.is_low(row["quality"])
+
+    async def _maybe_rescue(self, file_path, is_valid, url, rescue_queue):
+        if not (self.rescue and self.needs_rescue(file_path, is_valid, url)):
+            return
+
+        url = self.fixer.clean_target_url(url)
+        rescue_task = self.fixer.build_rescue_task(url, file_path)
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.ledger.set_state, self._tags(file_path), LOW_QUALITY
+        )
+        if self.cache:
+            cached = await asyncio.get_running_loop().run_in_executor(None, self.cache.get, rescue_task)
+            if cached is not None:
+                print(f"   💾 Rescue served from cache: {url}")
+                entry = {"url": url, "tag": file_path}
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._save_rescued, result_cache.with_tag(cached, file_path), entry
+                )
+                return
+
+        print(f"   🚑 Low quality, queueing rescue: {url}")
+        self.counts["rescue_queued"] += 1
+        await rescue_queue.put(rescue_task)
+
+    def _tags(self, file_path):
+        """Tag of the task saved at file_path followed by the tags folded into it"""
+        tag = os.path.relpath(file_path, self.base_output_folder)
+        return [tag] + self.deduper.extras(tag)
+
+    def _extra_paths(self, file_path):
+        """Paths of tasks folded into the one saved at file_path"""
+        return [os.path.join(self.base_output_folder, t) for t in self._tags(file_path)[1:]]
+
+    def _on_crawled(self, rescue_queue):
+        # The fetcher fans every saved result out to the duplicate tags
+        self.result_fetcher.fanout = self.deduper
+
+        async def on_result(task_res, entry):
+            file_path, is_valid = await self.result_fetcher._process_and_save_result(task_res)
+            self.counts["fetched"] += 1
+            await self._maybe_rescue(file_path, is_valid, entry["url"], rescue_queue)
+            return is_valid
+
+        return on_result
+
+    # ---------------- STAGE 4: RESCUE ----------------
+    def _save_rescued(self, task_res, entry):
+        tag_path = task_res.get("data", {}).get("tag") or entry["tag"]
+        if task_res.get("status_message") != "Ok.":
+            print(f"   ❌ Rescue API Error for {entry['url']}: {task_res.get('status_message')}")
+            return False
+
+        data = self.result_fetcher.store.save(tag_path, task_res, self._extra_paths(tag_path))
+        print(f"   ✨ Rescued! New size: {os.path.getsize(tag_path)/1024:.2f} KB")
+        fan_out(tag_path, self._extra_paths(tag_path))
+        self.ledger.set_state(self._tags(tag_path), RESCUED, size=os.path.getsize(tag_path))
+        self.manifest.record(
+            self.base_output_folder, [tag_path] + self._extra_paths(tag_path), meta=result_meta(task_res, data)
+        )
+        return True
+
+    # ---------------- ORCHESTRATION ----------------
+    async def _crawl_side(self, client, tasks, rescue_queue):
+        watcher = task_watcher.CompletionWatcher(client, ledger=self.ledger)
+        fetchers = [
+            asyncio.create_task(
+                task_watcher.fetch_ready(watcher, self._on_crawled(rescue_queue), cache=self.cache)
+            )
+            for _ in range(self.fetch_workers)
+        ]
+        try:
+            await asyncio.gather(
+                task_watcher.post_stream(
+                    client, tasks, watcher, self.result_fetcher.input_folder, f"pipeline_{self.run_id}"
+                ),
+                watcher.run(consumers=self.fetch_workers),
+            )
+            await asyncio.gather(*fetchers)
+        finally:
+            await rescue_queue.put(None)
+
+    async def _rescue_side(self, client, rescue_queue):
+        watcher = task_watcher.CompletionWatcher(client)
+        fetchers = [
+            asyncio.create_task(task_watcher.fetch_ready(watcher, self._save_rescued, cache=self.cache))
+            for _ in range(self.fetch_workers)
+        ]
+        os.makedirs("smart_fix", exist_ok=True)
+        await asyncio.gather(
+            task_watcher.post_stream(
+                client, rescue_queue, watcher, "smart_fix", f"pipeline_rescue_{self.run_id}"
+            ),
+            watcher.run(consumers=self.fetch_workers),
+        )
+        self.counts["rescued"] = sum(await asyncio.gather(*fetchers))
+
+    async def _run(self):
+        os.makedirs(main.OUTPUT_DIR, exist_ok=True)
+        self._initialize_summary_csv()
+
+        rows = asyncio.Queue(maxsize=QUEUE_SIZE)
+        tasks = asyncio.Queue(maxsize=QUEUE_SIZE)
+        rescue_queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        serp_out = asyncio.Queue(maxsize=self.serp_concurrency * 2)
+
+        async with http_client.AsyncClient() as client:
+            writer = asyncio.create_task(main.serp_writer(serp_out))
+            await asyncio.gather(
+                self.serp_stage(client, rows, serp_out),
+                self.task_stage(rows, tasks, rescue_queue),
+                self._crawl_side(client, tasks, rescue_queue),
+                self._rescue_side(client, rescue_queue),
+            )
+            await serp_out.put(None)
+            await writer
+
+    def run(self):
+        start_time = time.time()
+        asyncio.run(self._run())
+
+        print("\n" + "=" * 40)
+        print(f"🎉 Pipeline finished in {time.time() - start_time:.1f}s")
+        for key, value in self.counts.items():
+            print(f"   {key}: {value}")
+        print(f"📒 Ledger: {self.ledger.counts()}")
+        print(f"📈 API stats:\n{http_client.stats.summary()}")
+        print("=" * 40)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run SERP → post → fetch → rescue as one pipelined process")
+    parser.add_argument("--list", default="list.csv", help="CSV with Suburb,service columns")
+    parser.add_argument("--serp-concurrency", type=int, default=main.MAX_CONCURRENT)
+    parser.add_argument("--fetch-workers", type=int, default=FETCH_WORKERS)
+    parser.add_argument("--no-rescue", action="store_true", help="skip re-crawling low-quality results")
+    parser.add_argument("--no-cache", action="store_true", help="always crawl, ignoring the result cache")
+    args = parser.parse_args()
+
+    Pipeline(
+        list_csv=args.list,
+        serp_concurrency=args.serp_concurrency,
+        fetch_workers=args.fetch_workers,
+        rescue=not args.no_rescue,
+        use_cache=not args.no_cache,
+    ).run()
@@ -1,7 +1,10 @@
 import os
-import requests
 import json
 import time
+import heapq
+import asyncio
+
+import http_client
 
 def ensure_dir(path):
     if not os.path.exists(path):
@@ -15,10 +18,8 @@ def post_onpage_task(headers, payload, output_dir="queued_tasks", filename=None,
     """
     ensure_dir(output_dir)
 
-    endpoint = "https://api.dataforseo.com/v3/on_page/task_post"
-
     try:
-        resp = requests.post(endpoint, headers=headers, json=payload, timeout=timeout)
+        resp = http_client.post("on_page/task_post", payload, headers=headers, timeout=timeout)
     except Exception as e:
         print(f"❌ Post Request Failed: {e}")
         return None
@@ -39,72 +40,136 @@ def post_onpage_task(headers, payload, output_dir="queued_tasks", filename=None,
 
     return resp
 
+async def post_onpage_task_async(client, payload, output_dir="queued_tasks", filename=None, timeout=120):
+    """Async twin of `post_onpage_task` over a shared `http_client.AsyncClient`.
+
+    Returns (status, body); body is the parsed JSON on 200.
+    """
+    ensure_dir(output_dir)
+
+    try:
+        status, body = await client.post_json("on_page/task_post", payload, timeout=timeout)
+    except Exception as e:
+        print(f"❌ Post Request Failed: {e}")
+        return None, None
+
+    if filename:
+        out_path = os.path.join(output_dir, filename)
+        try:
+            with open(out_path, "w", encoding="utf-8") as f:
+                if isinstance(body, str):
+                    f.write(body)
+                else:
+                    json.dump(body, f, indent=4)
+        except Exception:
+            pass
+
+    return status, body
+
+# Task-level codes meaning "not finished yet"
+TASK_IN_PROGRESS_CODES = (40601, 40602)  # Task Handed / Task in Queue
+POLL_BACKOFF_FACTOR = 0.25  # re-check a task after ~25% of its age
+
+
+async def _check_task(client, tid):
+    """Returns (ready, task_data). task_data is None for tasks that failed."""
+    try:
+        status, body = await client.get_json(f"on_page/task_get/regular/{tid}")
+    except Exception as e:
+        print(f"⚠️ Polling Error for {tid}: {e}")
+        return False, None
+
+    if status != 200:
+        # Throttled / server error / not found yet: try again later
+        return False, None
+
+    task_data = (body.get("tasks") or [{}])[0]
+    if task_data.get("status_code") in TASK_IN_PROGRESS_CODES:
+        return False, None
+    if task_data.get("status_message") == "Ok.":
+        return True, task_data
+
+    # If invalid ID or error, stop checking this one
+    print(f"⚠️ Task {tid} Error: {task_data.get('status_message')}")
+    return True, None
+
+
+async def iter_task_results(client, task_ids, timeout=1200, max_concurrent=20,
+                            min_interval=2, max_interval=60, posted_at=None):
+    """Async generator yielding (task_id, task_data or None) as soon as each task is done.
+
+    Due tasks are checked concurrently (at most `max_concurrent` at a time).
+    Each task is re-checked after a delay proportional to its age, clamped to
+    [min_interval, max_interval], so fresh tasks are polled often and slow
+    ones back off. `posted_at` optionally maps task_id -> post timestamp.
+    """
+    semaphore = asyncio.Semaphore(max_concurrent)
+    start = time.time()
+    posted_at = posted_at or {}
+
+    schedule = [(start, tid) for tid in dict.fromkeys(task_ids)]
+    heapq.heapify(schedule)
+
+    async def check(tid):
+        async with semaphore:
+            return tid, await _check_task(client, tid)
+
+    while schedule:
+        now = time.time()
+        if now - start > timeout:
+            print(f"⏰ Polling timed out! ({len(schedule)} tasks still pending)")
+            return
+
+        due = []
+        while schedule and schedule[0][0] <= now:
+            due.append(heapq.heappop(schedule)[1])
+
+        if not due:
+            await asyncio.sleep(min(schedule[0][0], start + timeout) - now)
+            continue
+
+        for fut in asyncio.as_completed([check(tid) for tid in due]):
+            tid, (ready, task_data) = await fut
+            if ready:
+                yield tid, task_data
+                continue
+
+            checked_at = time.time()
+            age = checked_at - posted_at.get(tid, start)
+            delay = min(max(age * POLL_BACKOFF_FACTOR, min_interval), max_interval)
+            heapq.heappush(schedule, (checked_at + delay, tid))
+
+        if schedule:
+            print(f"⏳ Waiting for {len(schedule)} tasks... (Elapsed: {int(time.time()-start)}s)")
+
+
+async def poll_task_results_async(client, task_ids, on_result=None, **poll_opts):
+    """Streams each finished task to on_result(task_id, task_data) as it becomes ready.
+
+    Without a callback, returns a dict task_id -> task_data (or None if failed).
+    """
+    results_map = {}
+    async for tid, task_data in iter_task_results(client, task_ids, **poll_opts):
+        if on_result is not None:
+            on_result(tid, task_data)
+        else:
+            results_map[tid] = task_data
+    return results_map
+
+
 def poll_task_results(headers, task_ids, timeout=1200, check_interval=10):
     """
     Polls DataForSeo `task_get` endpoint for a list of task IDs.
     Returns a dictionary mapping task_id -> result_item (or None if failed).
-    
-    DataForSeo OnPage tasks usually take some time.
+
+    Thin sync wrapper over `poll_task_results_async`; `check_interval` caps the
+    per-task backoff. Auth comes from the shared pooled client, so `headers`
+    is kept for backwards compatibility only.
     """
-    results_map = {}
-    pending_ids = list(task_ids)
-    
-    start_time = time.time()
-    
-    while pending_ids:
-        if time.time() - start_time > timeout:
-            print("⏰ Polling timed out!")
-            break
-            
-        # Check tasks one by one (or batch if API supports specific batch get, 
-        # but standard way is individual or 'tasks_ready'). 
-        # Optimizing: DataForSEO has 'summary' or 'id' endpoints. 
-        # We will loop through pending IDs. To avoid hitting rate limits, we sleep.
-        
-        # Note: 'task_get' can return multiple tasks if we use the right endpoint or logic, 
-        # but standard pattern for simple integration:
-        
-        remaining_ids = []
-        
-        for tid in pending_ids:
-            # Endpoint for specific task
-            endpoint = f"https://api.dataforseo.com/v3/on_page/task_get/regular/{tid}"
-            try:
-                r = requests.get(endpoint, headers=headers)
-                if r.status_code == 200:
-                    data = r.json()
-                    # Check task status
-                    # structure: data['tasks'][0]['result'][0]...
-                    task_data = data.get('tasks', [{}])[0]
-                    
-                    # DataForSeo OnPage 'task_get' returns the result directly if ready?
-                    # Actually for OnPage specifically, 'task_post' is for crawl, 'task_get' gets the result.
-                    # If it's 200 OK, it usually means result is there.
-                    # We should check if 'result' is not null.
-                    
-                    if task_data.get('status_message') == 'Ok.':
-                        results_map[tid] = task_data
-                    else:
-                        # If invalid ID or error, stop checking this one
-                         print(f"⚠️ Task {tid} Error: {task_data.get('status_message')}")
-                         results_map[tid] = None
-                else:
-                    # If not ready, it might return 404 or specific code? 
-                    # Actually DataForSeo returns 200 but maybe 'status_code' inside JSON differs?
-                    # For OnPage, usually we wait. 
-                    remaining_ids.append(tid)
-                    
-            except Exception as e:
-                print(f"⚠️ Polling Error for {tid}: {e}")
-                remaining_ids.append(tid)
-                
-            time.sleep(0.5) # small delay between requests
-
-        pending_ids = remaining_ids
-        if not pending_ids:
-            break
-            
-        print(f"⏳ Waiting for {len(pending_ids)} tasks... (Elapsed: {int(time.time()-start_time)}s)")
-        time.sleep(check_interval)
+    async def _run():
+        async with http_client.AsyncClient() as client:
+            return await poll_task_results_async(
+                client, task_ids, timeout=timeout, max_interval=check_interval
+            )
 
-    return results_map
+    return asyncio.run(_run())
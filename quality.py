@@ -0,0 +1,119 @@
+import re
+
+import markdown_converter
+
+# ---------------- CONFIG ----------------
+MIN_WORDS = 150  # real content words (boilerplate blocks excluded) for a usable page
+CHALLENGE_MAX_WORDS = 400  # a challenge phrase only counts on pages shorter than this
+BOILERPLATE_MAX_WORDS = 60  # longer blocks are content even if they mention cookies etc.
+
+# Bot walls, CDN challenges and error pages that still come back as "finished" crawls
+CHALLENGE_RE = re.compile(
+    r"just a moment|checking your browser|verify(?:ing)? you are (?:a )?human|are you a robot"
+    r"|attention required|cf-chl|(?:complete|solve) the captcha|access denied|403 forbidden|404 not found"
+    r"|page not found|request unsuccessful|enable javascript and cookies|pardon our interruption",
+    re.IGNORECASE,
+)
+# Blocks that are on every page of a site and say nothing about the business
+BOILERPLATE_RE = re.compile(
+    r"cookie|privacy policy|terms (?:of use|and conditions|& conditions)|all rights reserved"
+    r"|copyright|©|sign up for our newsletter|subscribe to our newsletter",
+    re.IGNORECASE,
+)
+
+# ---------------- VERDICTS ----------------
+OK = "ok"
+API_ERROR = "api_error"  # task status_code != 20000 or no result
+NOT_CRAWLED = "not_crawled"  # crawl unfinished or 0 pages crawled
+HTTP_ERROR = "http_error"  # the page itself answered 4xx / 5xx
+CHALLENGE = "challenge"  # bot wall / challenge / error page
+THIN = "thin"  # fewer than MIN_WORDS words of real content
+
+LOW_QUALITY = (API_ERROR, NOT_CRAWLED, HTTP_ERROR, CHALLENGE, THIN)
+
+FIELDS = ("words", "headings", "status_code", "quality")
+VERSION = 2  # bump when scoring changes: manifests re-score their files on the next refresh
+
+
+# Page-content strings and the page's own HTTP status inside a raw (unparsed) task
+_RAW_BLOCK_RE = re.compile(rb'"(h_title|text)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+_RAW_ITEM_STATUS_RE = re.compile(rb'"items"\s*:\s*\[\s*\{[^{]*?"status_code"\s*:\s*(\d+)')
+_RAW_ESCAPE_RE = re.compile(r"\\(?:u([0-9a-fA-F]{4})|(.))")
+
+
+def _score(metrics, blocks):
+    """Add words / headings to metrics from (is_heading, text) blocks; returns the first 50 texts"""
+    text = []
+    for level, block in blocks:
+        if level:
+            metrics["headings"] += 1
+        words = len(block.split())
+        if words > BOILERPLATE_MAX_WORDS or not BOILERPLATE_RE.search(block):
+            metrics["words"] += words
+        if len(text) < 50:
+            text.append(block)
+    return text
+
+
+def _verdict(metrics, task_ok, crawled, text):
+    if not task_ok:
+        return API_ERROR
+    if not crawled:
+        return NOT_CRAWLED
+    if (metrics["status_code"] or 200) >= 400:
+        return HTTP_ERROR
+    if metrics["words"] < CHALLENGE_MAX_WORDS and CHALLENGE_RE.search(" ".join(text)):
+        return CHALLENGE
+    if metrics["words"] < MIN_WORDS:
+        return THIN
+    return OK
+
+
+def evaluate(task_result):
+    """Quality metrics of a content_parsing task result (see FIELDS), from the parsed dict.
+
+    `words` counts real content only: short blocks that match BOILERPLATE_RE
+    (cookie banners, footers) are left out.
+    """
+    result = (task_result.get("result") or [None])[0] or {}
+    items = result.get("items") or [{}]
+    item = items[0] or {}
+    metrics = {"words": 0, "headings": 0, "status_code": item.get("status_code")}
+
+    text = _score(metrics, markdown_converter.iter_blocks(markdown_converter.page_content_of(task_result)))
+    crawled = result.get("crawl_progress") == "finished" and (result.get("crawl_status") or {}).get("pages_crawled")
+    metrics["quality"] = _verdict(metrics, task_result.get("status_code") == 20000 and result, crawled, text)
+    return metrics
+
+
+def _unescape(match):
+    if match.group(1):
+        return chr(int(match.group(1), 16))
+    return " " if match.group(2) in "nrtbf" else match.group(2)
+
+
+def _raw_blocks(raw):
+    for match in _RAW_BLOCK_RE.finditer(raw):
+        block = _RAW_ESCAPE_RE.sub(_unescape, match.group(2).decode("utf-8", "replace")).strip()
+        if block:
+            yield match.group(1) == b"h_title", block
+
+
+def evaluate_raw(task):
+    """Same metrics for a passthrough.RawTask, scanned with regexes instead of parsed.
+
+    Every h_title / text string of the task counts (secondary content too), so
+    `words` can be a little higher than evaluate() gives for the same page.
+    """
+    status = _RAW_ITEM_STATUS_RE.search(task.raw)
+    metrics = {"words": 0, "headings": 0, "status_code": int(status.group(1)) if status else None}
+
+    text = _score(metrics, _raw_blocks(task.raw))
+    crawled = task.crawl_progress == "finished" and task.pages_crawled
+    metrics["quality"] = _verdict(metrics, task.status_code == 20000 and task.has_result, crawled, text)
+    return metrics
+
+
+def is_low(quality):
+    """True for a stored verdict that is worth a rescue (None = not a result, e.g. metadata rows)"""
+    return quality in LOW_QUALITY
@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+# ---------------- LIMITS (per endpoint family) ----------------
+# DataForSEO allows ~2000 calls/min per account; tasks_ready is capped lower.
+ENDPOINT_LIMITS = {
+    "serp_live": {"per_minute": 600, "max_in_flight": 20},
+    "serp_tasks": {"per_minute": 600, "max_in_flight": 10},
+    "on_page_post": {"per_minute": 600, "max_in_flight": 10},
+    "content_parsing": {"per_minute": 600, "max_in_flight": 10},
+    "tasks_ready": {"per_minute": 20, "max_in_flight": 1},
+    "default": {"per_minute": 600, "max_in_flight": 10},
+}
+
+# HTTP 429 plus DataForSEO "rate limit" / "too many requests" status codes
+THROTTLE_STATUS_CODES = {429, 40202, 40209, 50301}
+
+MIN_RATE_FRACTION = 0.05  # never slow below 5% of the configured rate
+RECOVERY_STEP = 0.05  # after a clean streak, add 5% of the configured rate
+RECOVERY_STREAK = 20  # clean responses needed before each speed-up
+
+
+def endpoint_family(path):
+    """Map an API path (or full URL) to its limiter family"""
+    path = path.lower()
+    if "tasks_ready" in path:
+        return "tasks_ready"
+    if "serp/" in path:
+        return "serp_live" if "/live/" in path else "serp_tasks"
+    if "on_page/task_post" in path:
+        return "on_page_post"
+    if "on_page/content_parsing" in path:
+        return "content_parsing"
+    return "default"
+
+
+class EndpointLimiter:
+    """Token bucket (requests per minute) plus an in-flight cap.
+
+    Thread-safe and usable from sync code and any event loop. On throttling
+    the rate halves; after RECOVERY_STREAK clean responses it climbs back
+    towards the configured rate (AIMD).
+    """
+
+    def __init__(self, name, per_minute, max_in_flight):
+        self.name = name
+        self.max_rate = per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = max(1.0, min(self.max_rate, max_in_flight))
+        self.tokens = self.capacity
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.clean_streak = 0
+        self.throttled = 0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _try_acquire(self):
+        """Take a slot if possible. Returns 0 on success, else seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.in_flight >= self.max_in_flight:
+                return 0.05
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            self.tokens -= 1
+            self.in_flight += 1
+            return 0
+
+    def acquire(self):
+        while True:
+            wait = self._try_acquire()
+            if not wait:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while True:
+            wait = self._try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def release(self, throttled=False):
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if throttled:
+                self.throttled += 1
+                self.clean_streak = 0
+                self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate / 2)
+                self.tokens = min(self.tokens, 0)
+                print(f"🐢 Throttled on {self.name}: slowing to {self.rate * 60:.0f}/min")
+            else:
+                self.clean_streak += 1
+                if self.rate < self.max_rate and self.clean_streak >= RECOVERY_STREAK:
+                    self.clean_streak = 0
+                    self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_STEP)
+
+    @contextmanager
+    def slot(self):
+        """Sync usage: `with limiter.slot() as s: ...; s.throttled = True`"""
+        self.acquire()
+        state = _SlotState()
+        try:
+            yield state
+        finally:
+            self.release(state.throttled)
+
+    @asynccontextmanager
+    async def slot_async(self):
+        await self.acquire_async()
+        state = _SlotState()
+        try:
+            yield state
+        finally:
+            self.release(state.throttled)
+
+
+class _SlotState:
+    __slots__ = ("throttled",)
+
+    def __init__(self):
+        self.throttled = False
+
+
+def is_throttled(http_status, api_status=None):
+    return http_status in THROTTLE_STATUS_CODES or api_status in THROTTLE_STATUS_CODES
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def configure(family, per_minute=None, max_in_flight=None):
+    """Override a family's limits (call before the first request)"""
+    limits = dict(ENDPOINT_LIMITS.get(family, ENDPOINT_LIMITS["default"]))
+    if per_minute is not None:
+        limits["per_minute"] = per_minute
+    if max_in_flight is not None:
+        limits["max_in_flight"] = max_in_flight
+    with _limiters_lock:
+        ENDPOINT_LIMITS[family] = limits
+        _limiters.pop(family, None)
+
+
+def limiter_for(path):
+    """Process-wide limiter shared by every caller of the same endpoint family"""
+    family = endpoint_family(path)
+    with _limiters_lock:
+        limiter = _limiters.get(family)
+        if limiter is None:
+            limits = ENDPOINT_LIMITS.get(family, ENDPOINT_LIMITS["default"])
+            limiter = EndpointLimiter(family, limits["per_minute"], limits["max_in_flight"])
+            _limiters[family] = limiter
+        return limiter
@@ -0,0 +1,417 @@
+import argparse
+import asyncio
+import csv
+import os
+import re
+import time
+
+import http_client
+import ledger
+import task_watcher
+from error_sink import shared_sink
+from manifest import Manifest, result_meta
+from result_cache import ResultCache
+from storage import ResultStore
+
+# ---------------- CRAWL SETTINGS ----------------
+# Full render: JS + browser rendering + anti-robot (smart_fix.py, the pipeline's rescues)
+FULL_RENDER_SETTINGS = {
+    "enable_content_parsing": True,
+    "max_crawl_pages": 1,
+    "enable_javascript": True,
+    "load_resources": True,
+    "enable_browser_rendering": True,
+    "enable_xhr": True,
+    "disable_cookie_popup": True,
+    "browser_preset": "desktop",
+    "proxy_country": "AU",
+    "use_advanced_anti_robot_protection": True,
+    "browser_wait_until": "fully_loaded",
+    "wait_for_content_timeout": 30,
+}
+# Light: plain fetch through another proxy pool (smart_fix_2.py)
+LIGHT_SETTINGS = {
+    "enable_content_parsing": True,
+    "max_crawl_pages": 1,
+    "enable_javascript": False,
+    "enable_browser_rendering": False,
+    "enable_xhr": False,
+    "switch_pool": True,
+    "proxy_country": "AU",
+}
+# Retry of failed / pending tasks with rendering (error-critical.py)
+RETRY_SETTINGS = {
+    "enable_content_parsing": True,
+    "max_crawl_pages": 1,
+    "enable_javascript": True,
+    "enable_browser_rendering": True,
+    "load_resources": True,
+    "disable_cookie_popup": True,
+    "browser_wait_until": "fully_loaded",
+}
+
+DIRECTORY_DOMAINS = [
+    'hipages.com.au', 'yelp.com', 'yelp.com.au', 'yellowpages.com.au',
+    'truelocal.com.au', 'facebook.com', 'instagram.com', 'starofservice.com.au',
+    'checkatrade.com', 'buy.nsw.gov.au', 'localsearch.com.au', 'au.nextdoor.com'
+]
+
+# Ledger rows retried by "errors" profiles: failed ones, and posted / ready ones stuck for PENDING_STALE_AFTER.
+# Rows never posted (serp_seen) or still crawling belong to on_page_post / on_page_get, not to a rescue.
+PENDING_STALE_AFTER = 24 * 3600  # seconds without progress before a posted task counts as pending
+
+REPORT_FIELDS = ['Issue', 'suburb', 'service', 'type', 'rank', 'rank_group', 'url', 'error_type', 'status']
+SCAN_FIELDS = ['Issue', 'suburb', 'rank_group', 'url', 'actual_size', 'crawl_status', 'quality', 'status', 'file_path']
+
+# ---------------- PROFILES ----------------
+# source:
+#   "low_quality" – results in `root` with a low quality verdict in the manifest (quality.py), top `max_rank`
+#                   non-directory URLs; re-saved in place. `report`: scan of every candidate (in root).
+#   "errors"      – failed / pending rows (ledger, or root/_error_summary.csv) of `type_contains` ranked
+#                   `min_rank`..`max_rank`; saved under `output`. `report`: failed retries (in output).
+# after: wait for that profile (when it runs too) before selecting targets, e.g. to rescue what it wrote.
+# fetch_workers / posters: this profile's concurrency; the API rate limits are shared (rate_limit.py).
+PROFILES = {
+    "full_render": {
+        "source": "low_quality",
+        "root": "parsed_content_markdowns",
+        "type_contains": "organic",
+        "max_rank": 10,
+        "settings": FULL_RENDER_SETTINGS,
+        "batch_dir": "smart_fix",
+        "file_prefix": "smart_fix_batch",
+        "report": "_final_scan_report.csv",
+        "ledger": True,
+        "after": "organic_top5",  # it selects from ledger rows this profile would flip to low_quality
+        "fetch_workers": 2,
+        "posters": 2,
+    },
+    "light_switch_pool": {
+        "source": "low_quality",
+        "root": "parsed_content_markdowns2",
+        "type_contains": None,
+        "max_rank": 10,
+        "settings": LIGHT_SETTINGS,
+        "batch_dir": "smart_fix",
+        "file_prefix": "smart_fix_v2_batch",
+        "report": None,
+        "ledger": False,
+        "after": "organic_top5",
+        "fetch_workers": 2,
+        "posters": 1,
+    },
+    "organic_top5": {
+        "source": "errors",
+        "root": "parsed_content_markdowns",
+        "output": "parsed_content_markdowns2",
+        "type_contains": "organic",
+        "min_rank": 1,
+        "max_rank": 5,
+        "settings": RETRY_SETTINGS,
+        "batch_dir": "parsed_content_markdowns2",
+        "file_prefix": "retry_batch",
+        "report": "_retry_organic_report.csv",
+        "ledger": False,
+        "fetch_workers": 2,
+        "posters": 2,
+    },
+}
+
+
+def profiles(*names, **overrides):
+    """{name: profile} for the named PROFILES (all of them by default), with `overrides` applied to each"""
+    return {name: dict(PROFILES[name], **overrides) for name in names or PROFILES}
+
+
+# ---------------- TASKS ----------------
+def clean_target_url(url):
+    """اصلاح یو‌ار‌ال مخصوص سایت Empire Roofing و حذف .php"""
+    if "empireroofing.com.au" in url.lower():
+        return re.sub(r'\.php$', '', url.strip())
+    return url.strip()
+
+
+def is_directory(url):
+    return any(domain in url.lower() for domain in DIRECTORY_DOMAINS)
+
+
+def build_task(settings, url, tag):
+    """task_post payload crawling `url` with `settings`; tag is the file path to (over)write"""
+    return dict(
+        settings,
+        target=re.sub(r'(https?://|www\.)', '', url).split('/')[0],  # domain
+        start_url=url,
+        url=url,
+        tag=tag,
+    )
+
+
+def output_root(profile):
+    return profile.get("output") or profile["root"]
+
+
+# ---------------- TARGETS ----------------
+def select_low_quality(name, profile):
+    """Targets ({url, tag, meta}) of a "low_quality" profile; writes its scan report"""
+    root = profile["root"]
+    if not os.path.exists(root):
+        print(f"❌ [{name}] Folder '{root}' not found!")
+        return []
+
+    print(f"🔍 [{name}] Scanning '{root}' for low-quality results...")
+    manifest = Manifest()
+    manifest.refresh(root)
+    targets = []
+    scan_rows = []
+    for item in manifest.files(root, suffix=".md", type_contains=profile["type_contains"], low_quality=True):
+        raw_url = item['url'] or ""
+        if "http" not in raw_url.lower():
+            continue
+
+        url = clean_target_url(raw_url)
+        r_grp = item['rank_group'] or 0
+        directory = is_directory(url)
+        issue_type = "Error (Directory)" if directory else "CRITICAL (Top 10)"
+        if not directory and r_grp > profile["max_rank"]:
+            issue_type = f"Error (Low Rank: {r_grp})"
+
+        scan_rows.append({
+            'Issue': issue_type,
+            'suburb': item['suburb'],
+            'rank_group': r_grp,
+            'url': url,
+            'actual_size': f"{item['size'] / 1024:.2f} KB",
+            'crawl_status': f"{item['crawl_progress']} ({item['pages_crawled']} pages)",
+            'quality': f"{item['quality']} ({item['words']} words, {item['headings']} headings,"
+                       f" HTTP {item['status_code']})",
+            'status': 'Pending' if issue_type == "CRITICAL (Top 10)" else 'Skipped',
+            'file_path': item['path'],
+        })
+        if issue_type == "CRITICAL (Top 10)":
+            targets.append({"url": url, "tag": item['path'], "meta": scan_rows[-1]})
+
+    if profile.get("report"):
+        with open(os.path.join(root, profile["report"]), mode='w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=SCAN_FIELDS)
+            writer.writeheader()
+            writer.writerows(scan_rows)
+
+    print(f"✅ [{name}] Found {len(targets)} top-{profile['max_rank']} targets.")
+    return targets
+
+
+def iter_error_rows(summary_csv_path):
+    """Rows to retry, shaped like _error_summary.csv. From the job ledger when there is one: failed rows
+    and posted / ready ones without progress for PENDING_STALE_AFTER."""
+    if not os.path.exists(ledger.LEDGER_PATH):
+        with open(summary_csv_path, mode='r', encoding='utf-8') as file:
+            yield from csv.DictReader(file)
+        return
+
+    jobs = ledger.Ledger()
+    stale = jobs.rows(ledger.IN_FLIGHT, updated_before=time.time() - PENDING_STALE_AFTER)
+    for job in jobs.rows(ledger.FAILED) + stale:
+        yield {
+            'Issue': "ERROR" if job['state'] == ledger.FAILED else "PENDING",
+            'suburb': job['suburb'],
+            'service': job['service'],
+            'type': job['type'],
+            'rank': job['rank_absolute'],
+            'rank_group': job['rank_group'],
+            'url': job['url'],
+            'status': job['error'] or job['state'],
+        }
+
+
+def select_errors(name, profile):
+    """Targets of an "errors" profile; starts its (failed retries) report"""
+    new_folder = output_root(profile)
+    os.makedirs(new_folder, exist_ok=True)
+    summary_csv_path = os.path.join(profile["root"], "_error_summary.csv")
+    if not os.path.exists(summary_csv_path) and not os.path.exists(ledger.LEDGER_PATH):
+        print(f"❌ [{name}] Error: {summary_csv_path} not found!")
+        return []
+
+    if profile.get("report"):
+        with open(os.path.join(new_folder, profile["report"]), 'w', newline='', encoding='utf-8') as f:
+            csv.DictWriter(f, fieldnames=REPORT_FIELDS).writeheader()
+
+    print(f"🚀 [{name}] Collecting tasks for retry...")
+    targets = []
+    skipped = 0
+    for row in iter_error_rows(summary_csv_path):
+        # (CRITICAL یا ERROR یا PENDING) + type + rank group range
+        issue_val = str(row.get('Issue', '')).upper().strip()
+        type_val = str(row.get('type', '')).lower().strip()
+        status_val = str(row.get('status', '')).lower().strip()
+        rank_gp = row.get('rank_group', '0')
+        try:
+            rg_int = int(rank_gp)
+        except (TypeError, ValueError):
+            rg_int = 100  # default high to skip
+
+        is_target = issue_val in ("CRITICAL", "ERROR") or "pending" in status_val or "pending" in issue_val.lower()
+        in_range = profile["min_rank"] <= rg_int <= profile["max_rank"]
+        if not (in_range and profile["type_contains"] in type_val and is_target):
+            skipped += 1
+            continue
+
+        url = row.get('url', '')
+        if not url or "google.com" in url or not url.startswith("http"):
+            continue
+
+        suburb = row.get('suburb', 'Unknown')
+        item_type = type_val.replace(' ', '_')
+        rank_abs = row.get('rank', '0')
+        target_path = os.path.join(new_folder, str(suburb).strip().replace(' ', '-'), item_type)
+        os.makedirs(target_path, exist_ok=True)
+
+        domain_match = re.sub(r'(https?://|www\.)', '', url).split('/')[0].split('.')[0]
+        file_path = os.path.join(target_path, f"type-{item_type}_rg{rank_gp}_ra{rank_abs}_{domain_match}.md")
+        targets.append({"url": url, "tag": file_path, "meta": {
+            "issue_val": issue_val,
+            "suburb": suburb,
+            "service": row.get('service', 'service'),
+            "type": item_type,
+            "rank": rank_abs,
+            "rank_group": rank_gp,
+            "url": url,
+        }})
+        print(f"➕ [{name}] Queued: {domain_match}")
+
+    print(f"⏭️ [{name}] Skipped (filter): {skipped}")
+    return targets
+
+
+SOURCES = {"low_quality": select_low_quality, "errors": select_errors}
+
+
+# ---------------- ENGINE ----------------
+def saver(name, profile, targets):
+    """(on_result, on_fanout) for task_watcher: save, index and (per profile) ledger / report the outcome.
+
+    on_fanout gives the duplicate paths linked to a saved result the same ledger / manifest update.
+    """
+    root = output_root(profile)
+    manifest = Manifest()
+    store = ResultStore(root)
+    jobs = ledger.Ledger() if profile.get("ledger") else None
+    by_tag = {target["tag"]: target for target in targets}
+    report_path = os.path.join(root, profile["report"]) if profile.get("report") else None
+
+    def record(paths, task_res, data=None):
+        if jobs is not None:
+            jobs.set_state([os.path.relpath(path, root) for path in paths], ledger.RESCUED,
+                           size=os.path.getsize(paths[0]))
+        manifest.record(root, paths, meta=result_meta(task_res, data))
+
+    def save_result(task_res, entry):
+        tag_path = task_res.get("data", {}).get("tag") or entry["tag"]
+        status_msg = task_res.get('status_message')
+        if status_msg != 'Ok.':
+            print(f"   ❌ [{name}] API Error for {entry['url']}: {status_msg}")
+            meta = by_tag.get(tag_path, {}).get("meta", {})
+            if profile["source"] == "errors" and report_path:
+                shared_sink().write_row(report_path, REPORT_FIELDS, {
+                    'Issue': f"RETRY_FAILED_{meta.get('issue_val', 'Unknown')}",
+                    'suburb': meta.get('suburb'),
+                    'service': meta.get('service'),
+                    'type': meta.get('type'),
+                    'rank': meta.get('rank'),
+                    'rank_group': meta.get('rank_group'),
+                    'url': meta.get('url'),
+                    'error_type': 'api_error',
+                    'status': status_msg,
+                })
+            return False
+
+        data = store.save(tag_path, task_res)
+        size = os.path.getsize(tag_path)
+        print(f"   ✨ [{name}] Success! New size: {size/1024:.2f} KB")
+        record([tag_path], task_res, data)
+        return True
+
+    def on_fanout(task_res, extra_paths):
+        record(extra_paths, task_res)
+
+    return save_result, on_fanout
+
+
+async def run_profile(client, name, profile, cache, finished):
+    """Select one profile's targets and rescue them. Returns (targets, saved)."""
+    try:
+        after = finished.get(profile.get("after"))
+        if after is not None:
+            print(f"⏳ [{name}] Waiting for {profile['after']}...")
+            await after.wait()
+
+        loop = asyncio.get_running_loop()
+        targets = await loop.run_in_executor(None, SOURCES[profile["source"]], name, profile)
+        if not targets:
+            print(f"🏁 [{name}] No targets.")
+            return 0, 0
+
+        if profile.get("ledger"):
+            tags = [os.path.relpath(target["tag"], profile["root"]) for target in targets]
+            await loop.run_in_executor(None, ledger.Ledger().set_state, tags, ledger.LOW_QUALITY)
+
+        batch_dir = profile.get("batch_dir") or output_root(profile)
+        os.makedirs(batch_dir, exist_ok=True)
+        tasks = [build_task(profile["settings"], target["url"], target["tag"]) for target in targets]
+        print(f"🚑 [{name}] Rescuing {len(tasks)} results...")
+        save_result, on_fanout = saver(name, profile, targets)
+        saved = await task_watcher.rescue(
+            client, tasks, save_result, batch_dir, profile["file_prefix"],
+            fetch_workers=profile.get("fetch_workers", 2), posters=profile.get("posters", 1), cache=cache,
+            on_fanout=on_fanout,
+        )
+        print(f"🏁 [{name}] Rescued {saved}/{len(targets)} files.")
+        return len(targets), saved
+    finally:
+        finished[name].set()
+
+
+async def run_async(selected, use_cache=True):
+    cache = ResultCache() if use_cache else None
+    finished = {name: asyncio.Event() for name in selected}
+    async with http_client.AsyncClient() as client:
+        results = await asyncio.gather(
+            *(run_profile(client, name, profile, cache, finished) for name, profile in selected.items()),
+            return_exceptions=True,
+        )
+
+    outcome = {}
+    for name, result in zip(selected, results):
+        if isinstance(result, Exception):
+            print(f"💥 [{name}] Rescue failed: {result}")
+            result = None
+        outcome[name] = result
+    return outcome
+
+
+def run(selected=None, use_cache=True):
+    """Run rescue profiles ({name: profile}, default all) side by side on one event loop.
+
+    Returns {name: (targets, saved)} (None for a profile that crashed).
+    """
+    selected = selected or profiles()
+    outcome = asyncio.run(run_async(selected, use_cache))
+    shared_sink().flush()
+    return outcome
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-crawl weak / failed results with one or more rescue profiles")
+    parser.add_argument("profiles", nargs="*", metavar="PROFILE", help=f"any of {', '.join(PROFILES)} (default: all)")
+    parser.add_argument("--no-cache", action="store_true", help="always crawl, ignoring the result cache")
+    args = parser.parse_args()
+    unknown = set(args.profiles) - set(PROFILES)
+    if unknown:
+        parser.error(f"unknown profile(s): {', '.join(sorted(unknown))}")
+
+    outcome = run(profiles(*args.profiles), use_cache=not args.no_cache)
+    print("\n" + "=" * 40)
+    for name, result in outcome.items():
+        print(f"   {name}: " + ("failed" if result is None else f"{result[1]}/{result[0]} rescued"))
+    print(f"📈 API stats:\n{http_client.stats.summary()}")
+    print("=" * 40)
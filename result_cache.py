@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import fastjson
+import quality
+import storage
+from manifest import result_meta
+from passthrough import RawTask
+
+CACHE_PATH = "_result_cache.sqlite"
+DEFAULT_TTL = 7 * 24 * 3600  # a week: business pages rarely change faster
+MAX_BYTES = 2 * 1024 ** 3  # compressed bytes kept before LRU eviction
+
+# Payload keys that identify the page rather than how it is crawled
+IDENTITY_KEYS = {"api", "function", "url", "target", "start_url", "tag"}
+TRACKING_PARAMS = ("utm_", "gclid", "fbclid", "msclkid")
+
+
+def normalize_url(url):
+    """Canonical form used for cache keys (case, default ports, fragments, tracking params)"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower() or "https"
+    host = (parts.hostname or "").lower()
+    if parts.port and not ((scheme, parts.port) in (("http", 80), ("https", 443))):
+        host = f"{host}:{parts.port}"
+
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/")
+
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(TRACKING_PARAMS)
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def crawl_settings(task_data):
+    """Everything in a task payload that changes how the page is crawled"""
+    return {k: v for k, v in task_data.items() if k not in IDENTITY_KEYS}
+
+
+def task_key(task_data):
+    """Stable key for "this URL crawled with these settings" """
+    url = task_data.get("start_url") or task_data.get("url") or ""
+    settings = json.dumps(crawl_settings(task_data), sort_keys=True)
+    return hashlib.sha256(f"{normalize_url(url)}\n{settings}".encode("utf-8")).hexdigest()
+
+
+def compress(task_result):
+    """Cache body of a task result: zlib-compressed compact JSON"""
+    return zlib.compress(storage.compact(task_result), 6)
+
+
+def is_cacheable(task_result):
+    """Only results scored OK are cached: a challenge / thin / error page must be crawled again"""
+    verdict = quality.evaluate_raw(task_result) if isinstance(task_result, RawTask) else quality.evaluate(task_result)
+    return verdict["quality"] == quality.OK
+
+
+def with_tag(task_result, tag):
+    """Copy of a cached task result re-addressed to another tag path"""
+    result = dict(task_result)
+    result["data"] = dict(task_result.get("data") or {}, tag=tag)
+    return result
+
+
+class ResultCache:
+    """Content-addressed content_parsing results (normalized URL + crawl settings).
+
+    Stored zlib-compressed in SQLite with a TTL and a size-bounded LRU.
+    Thread-safe; one instance can be shared by every worker of a run.
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=DEFAULT_TTL, max_bytes=MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, url TEXT, created_at REAL, last_access REAL,"
+            " size INTEGER, body BLOB)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_access ON results(last_access)")
+        self._conn.commit()
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def key_for(self, task_data):
+        return task_key(task_data)
+
+    def get(self, task_data):
+        """Cached task result for this URL + settings, or None"""
+        key = self.key_for(task_data)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at, size, body FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            created_at, size, body = row
+            if now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._conn.commit()
+                self.total_bytes -= size
+                self.misses += 1
+                return None
+
+        cached = fastjson.loads(zlib.decompress(body))
+        usable = is_cacheable(cached)
+        with self._lock:
+            # Stored before only OK results were cached: dropped, so the page is crawled again
+            if not usable:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._conn.commit()
+                self.total_bytes -= size
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return cached
+
+    def put(self, task_data, task_result):
+        """Store a finished result under the posted task's URL + settings (OK verdicts only). Returns True if stored."""
+        if not is_cacheable(task_result):
+            return False
+        self.put_compressed(task_data, compress(task_result))
+        return True
+
+    def put_compressed(self, task_data, body):
+        """Same as put() with the body already built by compress() (e.g. in a worker process).
+
+        The caller checks the verdict (is_cacheable / the saved quality) first.
+        """
+        key = self.key_for(task_data)
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, url, created_at, last_access, size, body)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, task_data.get("start_url") or task_data.get("url"), now, now, len(body), body),
+            )
+            self.total_bytes += len(body) - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop expired rows, then least recently used ones until under 90% of max_bytes"""
+        self._conn.execute("DELETE FROM results WHERE created_at < ?", (time.time() - self.ttl,))
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+        target = self.max_bytes * 0.9
+        rows = self._conn.execute("SELECT key, size FROM results ORDER BY last_access ASC").fetchall()
+        doomed = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            doomed.append((key,))
+            self.total_bytes -= size
+        self._conn.executemany("DELETE FROM results WHERE key = ?", doomed)
+
+    def materialize(self, task_data, output_folder="", manifest=None):
+        """On a hit, write the cached result to the task's tag path. Returns the path or None.
+
+        With a `manifest`, the file is recorded under output_folder with its quality verdict.
+        """
+        cached = self.get(task_data)
+        if cached is None:
+            return None
+
+        file_path = os.path.join(output_folder, task_data["tag"])
+        tagged = with_tag(cached, task_data["tag"])
+        data = storage.save(file_path, tagged)
+        if manifest is not None:
+            manifest.record(output_folder, file_path, meta=result_meta(tagged, data))
+        return file_path
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
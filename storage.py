@@ -0,0 +1,250 @@
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+
+import fastjson
+import markdown_converter
+from passthrough import RawTask
+
+try:
+    import zstandard
+except ImportError:  # optional: pip install zstandard
+    zstandard = None
+
+# ---------------- CONFIG ----------------
+# How saved task results are encoded. The file path (the task tag, "...md") never changes.
+#   "indent" – pretty JSON (legacy, what existing trees contain)
+#   "json"   – compact JSON
+#   "gzip"   – gzip-compressed compact JSON
+#   "zstd"   – zstd-compressed compact JSON (needs `zstandard`, falls back to gzip)
+# Audits use the quality verdict in the manifest (quality.py), not file size, so any format works.
+FORMAT = "indent"
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+# Optionally also append every record to a per-suburb shard: None, "jsonl" or "sqlite"
+SHARDS = None
+SHARD_FOLDER = "_shards"  # inside the output root; "_" keeps it out of the manifest
+VIEW_FOLDER = "_views"  # lazily rendered markdown, same layout as the results
+VIEWS_ON_SAVE = False  # also render the markdown view while the result is in memory
+# Save fetched content_parsing tasks as the exact bytes the API sent (passthrough.py) instead of
+# parsing and re-encoding them. "indent" then stores the API's compact JSON as-is.
+PASSTHROUGH = False
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+# ---------------- ENCODING ----------------
+def compact(task_result):
+    """Compact JSON bytes of a task result (a RawTask's original bytes, untouched)"""
+    if isinstance(task_result, RawTask):
+        return task_result.raw
+    return fastjson.dumps(task_result)
+
+
+def encode(task_result, fmt=None):
+    """Bytes to store for a task result in the given (or configured) format"""
+    fmt = fmt or FORMAT
+    if fmt == "indent" and not isinstance(task_result, RawTask):
+        return fastjson.dumps_indent(task_result)
+
+    raw = compact(task_result)
+    if fmt == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    if fmt in ("gzip", "zstd"):
+        return gzip.compress(raw, GZIP_LEVEL, mtime=0)
+    return raw
+
+
+def decode_bytes(data):
+    """Raw JSON bytes of a stored record, whatever format it was written in"""
+    if data[:2] == GZIP_MAGIC:
+        return gzip.decompress(data)
+    if data[:4] == ZSTD_MAGIC:
+        if zstandard is None:
+            raise RuntimeError("zstd-compressed result but `zstandard` is not installed")
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=1 << 31)
+    return data
+
+
+def head(data, size):
+    """First `size` bytes of the JSON text, decompressing only as much as needed"""
+    if data[:2] == GZIP_MAGIC:
+        return zlib.decompressobj(wbits=31).decompress(data, size)
+    if data[:4] == ZSTD_MAGIC and zstandard is not None:
+        reader = zstandard.ZstdDecompressor().stream_reader(data)
+        return reader.read(size)
+    return data[:size]
+
+
+def save(file_path, task_result, fmt=None):
+    """Write a task result to its tag path. Returns the bytes written.
+
+    Written to a temp file and renamed into place, so paths hardlinked to the
+    old file (FINAL_DATABASE, fan-out copies) keep their content until relinked.
+    """
+    data = encode(task_result, fmt)
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, file_path)
+    return data
+
+
+def load(file_path):
+    """Parsed task result from any stored format"""
+    with open(file_path, "rb") as f:
+        return fastjson.loads(decode_bytes(f.read()))
+
+
+def is_result(data):
+    """True for stored API results (metadata rows are plain "# Type ..." text)"""
+    return data[:2] == GZIP_MAGIC or data[:4] == ZSTD_MAGIC or data.lstrip()[:1] == b"{"
+
+
+# ---------------- SHARDS ----------------
+class ShardWriter:
+    """Appends records to one shard per suburb under <root>/_shards/.
+
+    "jsonl": one compact {"tag": ..., "result": ...} line per record.
+    "sqlite": table results(tag PRIMARY KEY, body) with zlib-compressed JSON,
+    so re-saving a tag replaces it.
+    """
+
+    def __init__(self, root, kind):
+        self.kind = kind
+        self.folder = os.path.join(root, SHARD_FOLDER)
+        self._lock = threading.Lock()
+        self._conns = {}
+
+    def append(self, rel_path, task_result):
+        suburb = rel_path.split(os.sep)[0] if os.sep in rel_path else "_root"
+        raw = compact(task_result)
+        with self._lock:
+            os.makedirs(self.folder, exist_ok=True)
+            if self.kind == "jsonl":
+                with open(os.path.join(self.folder, f"{suburb}.jsonl"), "a", encoding="utf-8") as f:
+                    f.write(f'{{"tag":{json.dumps(rel_path)},"result":{raw.decode("utf-8")}}}\n')
+                return
+
+            conn = self._conns.get(suburb)
+            if conn is None:
+                conn = sqlite3.connect(os.path.join(self.folder, f"{suburb}.sqlite"), check_same_thread=False)
+                conn.execute("CREATE TABLE IF NOT EXISTS results (tag TEXT PRIMARY KEY, body BLOB)")
+                self._conns[suburb] = conn
+            conn.execute(
+                "INSERT OR REPLACE INTO results (tag, body) VALUES (?, ?)",
+                (rel_path, zlib.compress(raw, GZIP_LEVEL)),
+            )
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            for conn in self._conns.values():
+                conn.close()
+            self._conns = {}
+
+
+class ResultStore:
+    """Saves task results under one output root in FORMAT (+ SHARDS when configured)"""
+
+    def __init__(self, root, fmt=None, shards=None, views=None):
+        self.root = root
+        self.fmt = fmt or FORMAT
+        shards = shards or SHARDS
+        self.shards = ShardWriter(root, shards) if shards else None
+        self.views = VIEWS_ON_SAVE if views is None else views
+
+    def save(self, file_path, task_result, extra_paths=()):
+        """Write to file_path (a path under root). Returns the bytes written.
+
+        extra_paths are fanned-out duplicates: they only need a shard record.
+        """
+        data = save(file_path, task_result, self.fmt)
+        if self.views:
+            markdown, _ = markdown_converter.convert(task_result)
+            markdown_converter.write_view(self.root, os.path.relpath(file_path, self.root), markdown)
+        if self.shards is not None:
+            for path in [file_path, *extra_paths]:
+                self.shards.append(os.path.relpath(path, self.root), task_result)
+        return data
+
+    def markdown(self, file_path):
+        return markdown_view(self.root, os.path.relpath(file_path, self.root))
+
+
+def iter_shard(shard_path):
+    """Yield (tag, task_result) from a .jsonl or .sqlite shard"""
+    if shard_path.endswith(".jsonl"):
+        with open(shard_path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = fastjson.loads(line)
+                yield record["tag"], record["result"]
+        return
+
+    conn = sqlite3.connect(shard_path)
+    try:
+        for tag, body in conn.execute("SELECT tag, body FROM results ORDER BY tag"):
+            yield tag, fastjson.loads(zlib.decompress(body))
+    finally:
+        conn.close()
+
+
+# ---------------- MARKDOWN VIEW ----------------
+def markdown_view(root, rel_path):
+    """Markdown for a stored result, rendered on first use and cached under <root>/_views/"""
+    return markdown_converter.convert_file(root, rel_path)[0]
+
+
+# ---------------- MIGRATION ----------------
+def convert_tree(root, fmt):
+    """Re-encode every stored result under root in `fmt`. Returns (files, bytes before, bytes after)."""
+    files = before = after = 0
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = [d for d in dir_names if not d.startswith("_")]
+        for file_name in file_names:
+            if file_name.startswith("_") or not file_name.endswith(".md"):
+                continue
+            file_path = os.path.join(dir_path, file_name)
+            with open(file_path, "rb") as f:
+                data = f.read()
+            if not is_result(data):
+                continue
+
+            stat = os.stat(file_path)
+            new_data = encode(fastjson.loads(decode_bytes(data)), fmt)
+            tmp_path = f"{file_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(new_data)
+            os.replace(tmp_path, file_path)
+            os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            files += 1
+            before += len(data)
+            after += len(new_data)
+    return files, before, after
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stored result formats and markdown views")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="re-encode every result under a folder")
+    convert.add_argument("root")
+    convert.add_argument("--format", choices=["indent", "json", "gzip", "zstd"], default="gzip")
+    view = sub.add_parser("view", help="print the markdown view of one result")
+    view.add_argument("root")
+    view.add_argument("rel_path")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        files, before, after = convert_tree(args.root, args.format)
+        ratio = before / after if after else 0
+        print(f"✅ Converted {files} files: {before/1024**2:.1f} MB → {after/1024**2:.1f} MB ({ratio:.1f}x)")
+    else:
+        sys.stdout.write(markdown_view(args.root, args.rel_path))
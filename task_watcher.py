@@ -0,0 +1,414 @@
+import asyncio
+import functools
+import time
+
+import fanout
+import http_client
+import passthrough
+import post_page
+import result_cache
+import storage
+from ledger import FAILED
+
+READY_ENDPOINT = "on_page/tasks_ready"
+FETCH_ENDPOINT = "on_page/content_parsing"
+FETCH_CHUNK = 100  # content_parsing accepts up to 100 IDs per POST
+
+
+def is_finished(task_result):
+    """True when a content_parsing task result holds a finished crawl"""
+    if isinstance(task_result, passthrough.RawTask):
+        return task_result.status_code == 20000 and task_result.has_result and task_result.crawl_progress == "finished"
+    if task_result.get("status_code") != 20000:
+        return False
+    result_list = task_result.get("result") or []
+    return bool(result_list) and result_list[0].get("crawl_progress") == "finished"
+
+
+def is_in_progress(task_result):
+    """True while the crawl is still running (status 20000, not finished): worth polling again.
+
+    Any other status_code is a permanent API error and is not retried.
+    """
+    if isinstance(task_result, passthrough.RawTask):
+        return task_result.status_code == 20000 and task_result.crawl_progress != "finished"
+    if task_result.get("status_code") != 20000:
+        return False
+    result_list = task_result.get("result") or [{}]
+    return (result_list[0] or {}).get("crawl_progress") != "finished"
+
+
+class CompletionWatcher:
+    """Hands posted task IDs to the fetch stage as soon as they are ready.
+
+    Polls `on_page/tasks_ready` (or another `ready_endpoint`, e.g. the SERP one)
+    every `poll_interval` seconds. A task that the endpoint never reports is
+    probed directly after `probe_after` seconds, and unfinished tasks are put
+    back on watch (with backoff) until `max_wait`. With a `ledger`, posted and
+    ready tasks are recorded there as well.
+    """
+
+    def __init__(self, client, poll_interval=5, probe_after=180, max_wait=900, ready_endpoint=READY_ENDPOINT,
+                 ledger=None):
+        self.client = client
+        self.ledger = ledger
+        self.ready_endpoint = ready_endpoint
+        self.poll_interval = poll_interval
+        self.probe_after = probe_after
+        self.max_wait = max_wait
+
+        self.pending = {}  # task_id -> entry, waiting to become ready
+        self.handed_off = {}  # task_id -> entry, queued for / being fetched
+        self.queue = asyncio.Queue()
+        self.closed = False
+
+    def watch(self, task_id, url, tag, meta=None):
+        """Register a freshly posted task"""
+        now = time.time()
+        self.pending[task_id] = {
+            "id": task_id,
+            "url": url,
+            "tag": tag,
+            "meta": meta,
+            "posted_at": now,
+            "probe_at": now + self.probe_after,
+            "attempts": 0,
+        }
+
+    def close(self):
+        """No more tasks will be registered"""
+        self.closed = True
+
+    @property
+    def done(self):
+        return self.closed and not self.pending and not self.handed_off
+
+    def resolve(self, task_id):
+        """Mark a handed-off task as finished for good"""
+        return self.handed_off.pop(task_id, None)
+
+    def retry(self, task_id):
+        """Put an unfinished task back on watch. Returns False once max_wait is spent."""
+        entry = self.handed_off.get(task_id)
+        if entry is None:
+            return False
+
+        now = time.time()
+        remaining = entry["posted_at"] + self.max_wait - now
+        if remaining <= 0:
+            return False
+
+        entry["attempts"] += 1
+        backoff = min(self.probe_after * (2 ** (entry["attempts"] - 1)), remaining)
+        entry["probe_at"] = now + backoff
+        self.pending[task_id] = self.handed_off.pop(task_id)
+        return True
+
+    def _hand_off(self, task_id):
+        entry = self.pending.pop(task_id)
+        self.handed_off[task_id] = entry
+        self.queue.put_nowait(entry)
+
+    async def _poll_ready(self):
+        status, data = await self.client.get_json(self.ready_endpoint)
+        if status != 200:
+            print(f"⚠️ tasks_ready error: {status}")
+            return set()
+
+        ready_ids = set()
+        for task in data.get("tasks") or []:
+            for item in task.get("result") or []:
+                if item.get("id"):
+                    ready_ids.add(item["id"])
+        return ready_ids
+
+    async def run(self, consumers=1):
+        """Poll until every registered task is resolved, then stop the consumers"""
+        while not self.done:
+            if self.pending:
+                try:
+                    ready_ids = await self._poll_ready()
+                except Exception as e:
+                    print(f"⚠️ tasks_ready connection error: {e}")
+                    ready_ids = set()
+
+                now = time.time()
+                for tid in list(self.pending):
+                    if tid in ready_ids or now >= self.pending[tid]["probe_at"]:
+                        self._hand_off(tid)
+
+                ours = [tid for tid in ready_ids if tid in self.handed_off]
+                if self.ledger is not None and ours:
+                    await asyncio.get_running_loop().run_in_executor(None, self.ledger.mark_ready, ours)
+
+                if self.pending:
+                    print(f"⏳ Watching {len(self.pending)} tasks ({len(self.handed_off)} fetching)...")
+
+            await asyncio.sleep(self.poll_interval)
+
+        for _ in range(consumers):
+            await self.queue.put(None)
+
+
+async def _post_and_watch(client, watcher, batch, output_dir, filename):
+    status, data = await post_page.post_onpage_task_async(
+        client, batch, output_dir=output_dir, filename=filename
+    )
+    if status != 200:
+        print(f"❌ Batch post failed ({filename})")
+        return
+
+    posted = []
+    rejected = []
+    for task in data.get("tasks", []):
+        tid = task.get("id")
+        task_data = task.get("data") or {}
+        if not (tid and task_data.get("tag")):
+            continue
+        if task.get("status_code") != 20100:
+            # Never created: nothing will ever become ready for it
+            print(f"   ❌ Task rejected ({task.get('status_code')} {task.get('status_message')}): {task_data.get('start_url')}")
+            rejected.append((task_data["tag"], f"API Error: {task.get('status_message')}"))
+            continue
+        watcher.watch(tid, task_data.get("start_url"), task_data["tag"], meta=task_data)
+        posted.append((task_data["tag"], tid))
+
+    loop = asyncio.get_running_loop()
+    if watcher.ledger is not None and posted:
+        await loop.run_in_executor(None, watcher.ledger.mark_posted, posted)
+    if watcher.ledger is not None:
+        for tag, error in rejected:
+            await loop.run_in_executor(None, functools.partial(watcher.ledger.set_state, tag, FAILED, error=error))
+
+
+async def post_batches(client, watcher, tasks, output_dir, file_prefix, batch_size=100, posters=1):
+    """Post tasks in batches (up to `posters` at once) and register every created task with the watcher"""
+    slots = asyncio.Semaphore(posters)
+
+    async def post_one(i):
+        async with slots:
+            batch = tasks[i:i + batch_size]
+            print(f"📡 Posting batch {i//batch_size + 1} ({len(batch)} tasks)...")
+            await _post_and_watch(client, watcher, batch, output_dir, f"{file_prefix}_{i}.json")
+
+    try:
+        await asyncio.gather(*(post_one(i) for i in range(0, len(tasks), batch_size)))
+    finally:
+        watcher.close()
+
+
+async def post_stream(client, source, watcher, output_dir, file_prefix, batch_size=100, linger=2.0, posters=4):
+    """Post tasks arriving on an asyncio.Queue (None-terminated).
+
+    A batch is posted as soon as it is full or `linger` seconds after its
+    first task arrived, with up to `posters` posts in flight.
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(posters)
+    in_flight = set()
+    batch_no = 0
+
+    async def post_one(batch, filename):
+        try:
+            print(f"📡 Posting {len(batch)} tasks ({filename})...")
+            await _post_and_watch(client, watcher, batch, output_dir, filename)
+        finally:
+            slots.release()
+
+    try:
+        finished = False
+        while not finished:
+            task = await source.get()
+            if task is None:
+                break
+
+            batch = [task]
+            deadline = loop.time() + linger
+            while len(batch) < batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    task = await asyncio.wait_for(source.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if task is None:
+                    finished = True
+                    break
+                batch.append(task)
+
+            await slots.acquire()
+            job = asyncio.create_task(post_one(batch, f"{file_prefix}_{batch_no}.json"))
+            in_flight.add(job)
+            job.add_done_callback(in_flight.discard)
+            batch_no += 1
+
+        if in_flight:
+            await asyncio.gather(*in_flight)
+    finally:
+        watcher.close()
+
+
+async def fetch_ready(watcher, on_result, chunk_size=FETCH_CHUNK, cache=None):
+    """Fetch ready tasks in chunks and hand each final result to on_result(task_res, entry).
+
+    on_result returns True when the result was saved. Plain functions run in a
+    worker thread; coroutine functions are awaited on the loop. Finished
+    results are stored in `cache` (a result_cache.ResultCache) when given.
+    With storage.PASSTHROUGH, task_res is a passthrough.RawTask (saved as the API's bytes).
+    """
+    loop = asyncio.get_running_loop()
+    saved = 0
+
+    while True:
+        entry = await watcher.queue.get()
+        if entry is None:
+            return saved
+
+        batch = [entry]
+        while len(batch) < chunk_size and not watcher.queue.empty():
+            nxt = watcher.queue.get_nowait()
+            if nxt is None:
+                watcher.queue.put_nowait(None)
+                break
+            batch.append(nxt)
+
+        print(f"📥 Fetching results for {len(batch)} tasks...")
+        payload = [{"id": e["id"], "url": e["url"]} for e in batch]
+        try:
+            status, res = await watcher.client.post_json(FETCH_ENDPOINT, payload, raw=storage.PASSTHROUGH)
+            if status == 200:
+                tasks = (
+                    await loop.run_in_executor(None, passthrough.split_response, res) if storage.PASSTHROUGH
+                    else res.get("tasks", [])
+                )
+        except Exception as e:
+            print(f"❌ Fetch Connection Error: {e}")
+            status, res = None, None
+
+        by_id = {e["id"]: e for e in batch}
+        if status == 200:
+            for task_res in tasks:
+                tid = task_res.get("id")
+                entry = by_id.pop(tid, None)
+                if entry is None:
+                    continue
+                if is_in_progress(task_res) and watcher.retry(tid):
+                    continue
+
+                # Finished, failed for good (non-20000) or out of time: handed to on_result now
+                watcher.resolve(tid)
+                try:
+                    if cache is not None and is_finished(task_res) and isinstance(entry["meta"], dict):
+                        await loop.run_in_executor(None, cache.put, entry["meta"], task_res)
+                except Exception as e:
+                    print(f"   ⚠️ Cache write failed {entry['tag']}: {e}")
+                try:
+                    if asyncio.iscoroutinefunction(on_result):
+                        ok = await on_result(task_res, entry)
+                    else:
+                        ok = await loop.run_in_executor(None, on_result, task_res, entry)
+                    if ok:
+                        saved += 1
+                except Exception as e:
+                    print(f"   💥 Save Error {entry['tag']}: {e}")
+        elif status is not None:
+            print(f"❌ Fetch API Error: {status}")
+
+        # Anything the API did not answer for gets another chance
+        for tid, entry in by_id.items():
+            if not watcher.retry(tid):
+                watcher.resolve(tid)
+                print(f"   ⌛ Gave up on {entry['url']} after {watcher.max_wait}s")
+
+
+def _serve_from_cache(tasks, on_result, cache):
+    """Answer tasks straight from the cache. Returns (tasks still to post, results saved)."""
+    to_post = []
+    saved = 0
+    for task in tasks:
+        cached = cache.get(task)
+        if cached is None:
+            to_post.append(task)
+            continue
+
+        print(f"   💾 Cache hit: {task.get('start_url')}")
+        entry = {"id": cached.get("id"), "url": task.get("start_url"), "tag": task["tag"], "meta": task}
+        try:
+            if on_result(result_cache.with_tag(cached, task["tag"]), entry):
+                saved += 1
+        except Exception as e:
+            print(f"   💥 Save Error {task['tag']}: {e}")
+    return to_post, saved
+
+
+def _with_fanout(on_result, deduper, on_fanout=None):
+    """Wrap a sync on_result so a saved primary is linked to its duplicate tags.
+
+    on_fanout(task_res, extra_tags) records the linked copies (ledger, manifest).
+    Returns (wrapped, fanned) where fanned["saved"] counts the linked copies.
+    """
+    fanned = {"saved": 0}
+
+    def wrapped(task_res, entry):
+        ok = on_result(task_res, entry)
+        extras = deduper.extras(entry["tag"])
+        if ok and extras:
+            fanout.fan_out(entry["tag"], extras)
+            if on_fanout is not None:
+                on_fanout(task_res, extras)
+            fanned["saved"] += len(extras)
+            print(f"   🔗 Fanned out to {len(extras)} duplicate paths")
+        return ok
+    return wrapped, fanned
+
+
+async def rescue(client, tasks, on_result, output_dir, file_prefix, batch_size=100, fetch_workers=2, posters=1,
+                  cache=None, on_fanout=None, **watch_opts):
+    """run_rescue on a running loop with a caller-owned client.
+
+    Several rescues can run side by side on one loop; their posts and fetches
+    share the process-wide limits of rate_limit.py. Returns the results saved.
+    """
+    loop = asyncio.get_running_loop()
+    deduper = fanout.Deduper()
+    tasks = [task for task in tasks if deduper.add(task)]
+    fanned = {"saved": 0}
+    if deduper.collapsed:
+        print(f"🔗 Collapsed {deduper.collapsed} duplicate URLs into shared tasks")
+        on_result, fanned = _with_fanout(on_result, deduper, on_fanout)
+
+    saved = 0
+    if cache is not None:
+        tasks, saved = await loop.run_in_executor(None, _serve_from_cache, tasks, on_result, cache)
+    if not tasks:
+        return saved + fanned["saved"]
+
+    watcher = CompletionWatcher(client, **watch_opts)
+    fetchers = [asyncio.create_task(fetch_ready(watcher, on_result, cache=cache)) for _ in range(fetch_workers)]
+    await asyncio.gather(
+        post_batches(client, watcher, tasks, output_dir, file_prefix, batch_size, posters),
+        watcher.run(consumers=fetch_workers),
+    )
+    saved += sum(await asyncio.gather(*fetchers))
+    return saved + fanned["saved"]
+
+
+def run_rescue(tasks, on_result, output_dir, file_prefix, batch_size=100, fetch_workers=2,
+               cache=None, on_fanout=None, **watch_opts):
+    """Post → watch tasks_ready → fetch, with posting overlapping the waiting.
+
+    Tasks for the same URL + crawl settings are posted once and the saved
+    result is linked to every duplicate tag (tags are file paths here). With a
+    `cache`, tasks fetched before are answered without an API call. Returns
+    the number of files saved: results for which on_result returned True plus
+    the duplicate tags linked to them (reported to on_fanout(task_res, extra_tags)).
+    """
+    async def run():
+        async with http_client.AsyncClient() as client:
+            return await rescue(
+                client, tasks, on_result, output_dir, file_prefix, batch_size, fetch_workers, cache=cache,
+                on_fanout=on_fanout, **watch_opts,
+            )
+
+    return asyncio.run(run())